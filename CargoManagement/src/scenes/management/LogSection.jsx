@@ -25,11 +25,18 @@ const LogSection = () => {
         if (value) params[key] = value;
       });
 
-      const response = await axios.get("http://localhost:8000/api/logs", {
-        params
-      });
+      // The API returns one page at a time; follow nextCursor until every log is loaded
+      const allLogs = [];
+      let cursor = null;
+      do {
+        const response = await axios.get("http://localhost:8000/api/logs", {
+          params: cursor ? { ...params, cursor } : params
+        });
+        allLogs.push(...(response.data.logs || []));
+        cursor = response.data.nextCursor;
+      } while (cursor);
 
-      setLogs(response.data.logs || []);
+      setLogs(allLogs);
     } catch (err) {
       console.error("Failed to fetch logs:", err);
       alert("Failed to fetch logs.");
@@ -1,71 +1,235 @@
 from typing import List, Dict, Optional
+import time
 from models import Item, Container, PlacementResponse, Placement, Rearrangement, Position, Coordinates, SearchResponse, ItemLocation, RetrievalStep
+from packing_algorithms import ContainerSpace, ContainerIndex, find_best_position
+from spatial_index import position_from_document, position_to_box
 
-def calculate_placement(items: List[Item], containers: List[Container]) -> PlacementResponse:
+# Packing heuristics understood by calculate_placement
+PLACEMENT_STRATEGIES = ("priority", "volume", "zone-strict", "zone-relaxed")
+
+# How many stored low-priority items are tried as candidates to make room for one new item
+MAX_DISPLACEMENT_CANDIDATES = 32
+
+def calculate_placement(
+    items: List[Item],
+    containers: List[Container],
+    existing: Optional[List[Dict]] = None,
+    time_budget_ms: Optional[int] = None,
+    strategy: str = "priority"
+) -> PlacementResponse:
+    """
+    Algorithm to plan where a batch of items should be stored
+    
+    Args:
+        items: Items to place, highest priority placed first
+        containers: Containers available for the batch
+        existing: Optional stored placements (with the stored item's priority and
+            preferredZone) to plan around instead of treating containers as empty
+        time_budget_ms: Optional time limit; items are planned in priority order,
+            so the plan returned when it runs out covers the most important items
+        strategy: Packing heuristic, one of PLACEMENT_STRATEGIES:
+            "priority" places high-priority items first and spills over into other zones when full,
+            "volume" places large items first,
+            "zone-strict" never leaves the preferred zone,
+            "zone-relaxed" ignores the preferred zone
+        
+    Returns:
+        PlacementResponse with the placements and the steps to carry them out
+    """
     placements = []
     rearrangements = []
     step_counter = 1
+    complete = True
+    deadline = time.monotonic() + time_budget_ms / 1000 if time_budget_ms else None
+    
+    # Collect what is already stored in the containers
+    container_ids = {container.containerId for container in containers}
+    stored = {}
+    stored_boxes = {}
+    for entry in existing or []:
+        position = position_from_document(entry)
+        if position is None or entry.get("containerId") not in container_ids:
+            continue
+        stored[entry["itemId"]] = entry
+        stored_boxes.setdefault(entry["containerId"], []).append((entry["itemId"], *position_to_box(position)))
+    
+    # Free space of every container is tracked across the whole batch.
+    # Stored items count towards the smallest side, since a displaced one may have to be placed again.
+    min_side = min(
+        [min(item.width, item.depth, item.height) for item in items] +
+        [min(end[axis] - start[axis] for axis in range(3)) for boxes in stored_boxes.values() for _, start, end in boxes],
+        default=0
+    )
+    spaces = {container.containerId: ContainerSpace(container, min_side) for container in containers}
+    
+    # Seed the containers with what is already stored in them
+    for container_id, boxes in stored_boxes.items():
+        spaces[container_id].load(boxes)
     
-    zone_containers = {}
-    for container in containers:
-        if container.zone not in zone_containers:
-            zone_containers[container.zone] = []
-        zone_containers[container.zone].append(container)
+    container_index = ContainerIndex(list(spaces.values()))
     
-    sorted_items = sorted(items, key=lambda x: x.priority, reverse=True)
+    if strategy == "volume":
+        sorted_items = sorted(items, key=lambda x: (x.width * x.depth * x.height, x.priority), reverse=True)
+    else:
+        sorted_items = sorted(items, key=lambda x: x.priority, reverse=True)
+    
+    # Items that already have a placement in the plan, e.g. stored items moved out of the way
+    handled = set()
     
     for item in sorted_items:
-        target_containers = zone_containers.get(item.preferredZone, [])
+        if item.itemId in handled:
+            continue
         
-        if not target_containers:
-            target_containers = [c for containers_list in zone_containers.values() for c in containers_list]
+        if deadline is not None and time.monotonic() >= deadline:
+            print(f"Placement time budget of {time_budget_ms}ms ran out, returning a partial plan")
+            complete = False
+            break
         
-        if not target_containers:
+        # Items that are already stored keep their place
+        if item.itemId in stored:
+            entry = stored.pop(item.itemId)
+            placements.append(Placement(
+                itemId=item.itemId,
+                containerId=entry["containerId"],
+                position=position_from_document(entry),
+                rotation=entry.get("rotation", 0)
+            ))
             continue
-            
-        placed = False
-        for container in target_containers:
-            if (item.width <= container.width and 
-                item.depth <= container.depth and 
-                item.height <= container.height):
-                
-                placement = Placement(
-                    itemId=item.itemId,
-                    containerId=container.containerId,
-                    position=Position(
-                        startCoordinates=Coordinates(width=0, depth=0, height=0),
-                        endCoordinates=Coordinates(
-                            width=item.width,
-                            depth=item.depth,
-                            height=item.height
-                        )
-                    )
-                )
-                placements.append(placement)
-                
-                rearrangement = Rearrangement(
+        
+        dims = (item.width, item.depth, item.height)
+        
+        # Try the preferred zone first, then spill over into the other zones once it is full
+        if strategy == "zone-relaxed":
+            best = find_best_position(container_index.any_zone(dims), dims)
+        else:
+            best = find_best_position(container_index.in_zone(item.preferredZone, dims), dims)
+            if best is None and (strategy != "zone-strict" or not container_index.has_zone(item.preferredZone)):
+                best = find_best_position(container_index.outside_zone(item.preferredZone, dims), dims)
+        
+        # Only when there is no free space left, move a stored lower-priority item out of the way
+        displaced = None
+        if best is None and stored:
+            displaced = _make_room(item, dims, container_index, stored)
+            if displaced is not None:
+                best = displaced[0]
+        
+        if best is None:
+            print(f"No free space found for item {item.itemId}")
+            continue
+        
+        space, start, rotated_dims, rotation = best
+        placement = Placement(
+            itemId=item.itemId,
+            containerId=space.container_id,
+            position=space.place(item.itemId, start, rotated_dims),
+            rotation=rotation
+        )
+        
+        if displaced is not None:
+            _, moved_id, from_space, from_position = displaced
+            moved = _relocate(moved_id, stored.pop(moved_id), from_position, container_index)
+            if moved is not None:
+                placements.append(moved)
+                handled.add(moved_id)
+                rearrangements.append(Rearrangement(
                     step=step_counter,
-                    action="place",
-                    itemId=item.itemId,
-                    toContainer=container.containerId,
-                    toPosition=placement.position
-                )
-                rearrangements.append(rearrangement)
-                step_counter += 1
-                
-                placed = True
-                break
+                    action="move",
+                    itemId=moved_id,
+                    fromContainer=from_space.container_id,
+                    fromPosition=from_position,
+                    toContainer=moved.containerId,
+                    toPosition=moved.position
+                ))
+            else:
+                rearrangements.append(Rearrangement(
+                    step=step_counter,
+                    action="remove",
+                    itemId=moved_id,
+                    fromContainer=from_space.container_id,
+                    fromPosition=from_position
+                ))
+            step_counter += 1
         
-        if not placed:
-            pass
+        placements.append(placement)
+        
+        rearrangement = Rearrangement(
+            step=step_counter,
+            action="place",
+            itemId=item.itemId,
+            toContainer=space.container_id,
+            toPosition=placement.position
+        )
+        rearrangements.append(rearrangement)
+        step_counter += 1
     
     return PlacementResponse(
         success=len(placements) > 0,
         placements=placements,
-        rearrangements=rearrangements
+        rearrangements=rearrangements,
+        complete=complete
     )
 
-def search_item_algorithm(item_data: Dict, container_data: Optional[Dict] = None) -> SearchResponse:
+def _make_room(item: Item, dims, container_index: ContainerIndex, stored: Dict[str, Dict]):
+    """
+    Free space for an item by taking out one stored item of lower priority
+    
+    Returns:
+        Tuple of (placement candidate, displaced item id, its container space, its old position),
+        or None if no single displacement makes the item fit
+    """
+    for targets in (container_index.in_zone(item.preferredZone, dims), container_index.outside_zone(item.preferredZone, dims)):
+        candidates = sorted(
+            (stored[box_id].get("priority", 0), box_id, space)
+            for space in targets
+            for box_id in space.box_ids
+            if box_id in stored and stored[box_id].get("priority", 0) < item.priority
+        )
+        for _, box_id, space in candidates[:MAX_DISPLACEMENT_CANDIDATES]:
+            old_position = space.remove(box_id)
+            best = find_best_position([space], dims)
+            if best is not None:
+                return best, box_id, space, old_position
+            # Put the stored item back exactly where it was
+            old_start, old_end = position_to_box(old_position)
+            space.place(box_id, old_start, tuple(old_end[axis] - old_start[axis] for axis in range(3)))
+    return None
+
+def _relocate(item_id: str, entry: Dict, from_position: Position, container_index: ContainerIndex) -> Optional[Placement]:
+    """Find a new place for a displaced stored item, preferring its own zone"""
+    start, end = position_to_box(from_position)
+    dims = tuple(end[axis] - start[axis] for axis in range(3))
+    zone = entry.get("preferredZone", "")
+    best = find_best_position(container_index.in_zone(zone, dims), dims)
+    if best is None:
+        best = find_best_position(container_index.outside_zone(zone, dims), dims)
+    if best is None:
+        return None
+    space, new_start, rotated_dims, rotation = best
+    return Placement(
+        itemId=item_id,
+        containerId=space.container_id,
+        position=space.place(item_id, new_start, rotated_dims),
+        rotation=rotation
+    )
+
+def search_item_algorithm(
+    item_data: Dict,
+    container_data: Optional[Dict] = None,
+    position: Optional[Position] = None,
+    blockers: Optional[List[Dict]] = None
+) -> SearchResponse:
+    """
+    Algorithm to locate an item and plan the steps needed to retrieve it
+    
+    Args:
+        item_data: Item document from the database
+        container_data: Container document the item is stored in
+        position: Stored position of the item, if known
+        blockers: Items between the item and the open face of the container, front-most first
+        
+    Returns:
+        SearchResponse with the item location and retrieval steps
+    """
     if not item_data:
         return SearchResponse(success=True, found=False)
     
@@ -77,14 +241,15 @@ def search_item_algorithm(item_data: Dict, container_data: Optional[Dict] = None
             retrievalSteps=[]
         )
     
-    position = Position(
-        startCoordinates=Coordinates(width=0, depth=0, height=0),
-        endCoordinates=Coordinates(
-            width=item_data.get("width", 10),
-            depth=item_data.get("depth", 10),
-            height=item_data.get("height", 10)
+    if position is None:
+        position = Position(
+            startCoordinates=Coordinates(width=0, depth=0, height=0),
+            endCoordinates=Coordinates(
+                width=item_data.get("width", 10),
+                depth=item_data.get("depth", 10),
+                height=item_data.get("height", 10)
+            )
         )
-    )
     
     item_location = ItemLocation(
         itemId=item_data["itemId"],
@@ -94,69 +259,63 @@ def search_item_algorithm(item_data: Dict, container_data: Optional[Dict] = None
         position=position
     )
     
+    if blockers is None and container_data["zone"] == "Airlock" and "blocker_item" in item_data:
+        blockers = [item_data["blocker_item"]]
+    
+    return SearchResponse(
+        success=True,
+        found=True,
+        item=item_location,
+        retrievalSteps=plan_retrieval_steps(item_data, blockers or [])
+    )
+
+def plan_retrieval_steps(item_data: Dict, blockers: List[Dict], first_step: int = 1) -> List[RetrievalStep]:
+    """
+    Build the steps to take an item out from behind the items blocking it
+    
+    Args:
+        item_data: Item to retrieve
+        blockers: Items in front of it, front-most first
+        first_step: Number of the first step
+        
+    Returns:
+        List of retrieval steps
+    """
     retrieval_steps = []
+    step = first_step
     
-    if container_data["zone"] == "Airlock":
-        if "blocker_item" in item_data:
-            blocker_item = item_data["blocker_item"]
-            
-            retrieval_steps.append(
-                RetrievalStep(
-                    step=1,
-                    action="remove",
-                    itemId=blocker_item["itemId"],
-                    itemName=blocker_item["name"]
-                )
-            )
-            
-            retrieval_steps.append(
-                RetrievalStep(
-                    step=2,
-                    action="setAside",
-                    itemId=blocker_item["itemId"],
-                    itemName=blocker_item["name"]
-                )
-            )
-            
+    for blocker in blockers:
+        for action in ("remove", "setAside"):
             retrieval_steps.append(
                 RetrievalStep(
-                    step=3,
-                    action="retrieve",
-                    itemId=item_data["itemId"],
-                    itemName=item_data["name"]
+                    step=step,
+                    action=action,
+                    itemId=blocker["itemId"],
+                    itemName=blocker["name"]
                 )
             )
-            
-            retrieval_steps.append(
-                RetrievalStep(
-                    step=4,
-                    action="placeBack",
-                    itemId=blocker_item["itemId"],
-                    itemName=blocker_item["name"]
-                )
-            )
-        else:
-            retrieval_steps.append(
-                RetrievalStep(
-                    step=1,
-                    action="retrieve",
-                    itemId=item_data["itemId"],
-                    itemName=item_data["name"]
-                )
-            )
-    else:
+            step += 1
+    
+    retrieval_steps.append(
+        RetrievalStep(
+            step=step,
+            action="retrieve",
+            itemId=item_data["itemId"],
+            itemName=item_data["name"]
+        )
+    )
+    step += 1
+    
+    # Put the blockers back in reverse order so the arrangement is restored
+    for blocker in reversed(blockers):
         retrieval_steps.append(
             RetrievalStep(
-                step=1,
-                action="retrieve",
-                itemId=item_data["itemId"],
-                itemName=item_data["name"]
+                step=step,
+                action="placeBack",
+                itemId=blocker["itemId"],
+                itemName=blocker["name"]
             )
         )
+        step += 1
     
-    return SearchResponse(
-        success=True,
-        found=True,
-        item=item_location,
-        retrievalSteps=retrieval_steps
-    )
\ No newline at end of file
+    return retrieval_steps
@@ -0,0 +1,121 @@
+import struct
+from typing import Dict, Iterable, List, Tuple
+import numpy as np
+
+# Packed little-endian arrangement buffer read by the 3D viewer
+#
+#   header        ARRANGEMENT_HEADER: magic, version, string count,
+#                 container count, item count, string data length
+#   string table  uint32 offsets[string count + 1], then the UTF-8 string data,
+#                 padded with zeros to a multiple of 4 bytes
+#   containers    CONTAINER_DTYPE records
+#   items         ITEM_DTYPE records
+#
+# Every section starts on a 4-byte boundary, so a client can view the record
+# sections directly as typed arrays. Ids and zones are indexes into the string table.
+ARRANGEMENT_MAGIC = b"ARRB"
+ARRANGEMENT_VERSION = 1
+ARRANGEMENT_HEADER = struct.Struct("<4sHHIIII")  # magic, version, reserved, strings, containers, items, string bytes
+
+CONTAINER_DTYPE = np.dtype([
+    ("id", "<u4"),
+    ("zone", "<u4"),
+    ("size", "<f4", (3,)),    # width, depth, height
+])
+
+ITEM_DTYPE = np.dtype([
+    ("id", "<u4"),
+    ("container", "<u4"),
+    ("start", "<f4", (3,)),   # width, depth, height
+    ("end", "<f4", (3,)),
+    ("rotation", "u1"),
+    ("pad", "u1", (3,)),
+])
+
+class StringTable:
+    """Interns strings and assigns each a stable index"""
+
+    def __init__(self):
+        self.index: Dict[str, int] = {}
+
+    def add(self, value: str) -> int:
+        if value not in self.index:
+            self.index[value] = len(self.index)
+        return self.index[value]
+
+    def encode(self) -> Tuple[bytes, int]:
+        """
+        Returns:
+            Tuple of (offsets and padded data, unpadded data length)
+        """
+        encoded = [value.encode("utf-8") for value in self.index]
+        offsets = np.zeros(len(encoded) + 1, dtype="<u4")
+        np.cumsum([len(value) for value in encoded], out=offsets[1:])
+        data = b"".join(encoded)
+        padding = b"\0" * (-len(data) % 4)
+        return offsets.tobytes() + data + padding, len(data)
+
+def _coordinates(coordinates: Dict, default: Tuple[float, float, float]) -> Tuple[float, float, float]:
+    if not coordinates:
+        return default
+    return coordinates.get("width", 0), coordinates.get("depth", 0), coordinates.get("height", 0)
+
+def encode_arrangement(containers: Iterable[Dict], placements: Iterable[Dict]) -> bytes:
+    """
+    Pack containers and placed item boxes into one binary buffer
+
+    The records are collected column by column and written into NumPy
+    structured arrays, so each section is encoded with a single copy.
+
+    Args:
+        containers: Container documents with containerId, zone, width, depth and height
+        placements: Placement documents with itemId, containerId, position and rotation
+
+    Returns:
+        The packed buffer, laid out as described at the top of this module
+    """
+    strings = StringTable()
+
+    container_ids: List[int] = []
+    zones: List[int] = []
+    sizes: List[Tuple[float, float, float]] = []
+    for container in containers:
+        container_ids.append(strings.add(container["containerId"]))
+        zones.append(strings.add(container.get("zone", "")))
+        sizes.append((container.get("width", 0), container.get("depth", 0), container.get("height", 0)))
+
+    item_ids: List[int] = []
+    item_containers: List[int] = []
+    starts: List[Tuple[float, float, float]] = []
+    ends: List[Tuple[float, float, float]] = []
+    rotations: List[int] = []
+    for placement in placements:
+        item_ids.append(strings.add(placement["itemId"]))
+        item_containers.append(strings.add(placement["containerId"]))
+        position = placement.get("position") or {}
+        # Placements stored before positions were kept only have their start corner
+        start = _coordinates(position.get("startCoordinates"), (placement.get("x", 0), placement.get("y", 0), placement.get("z", 0)))
+        starts.append(start)
+        ends.append(_coordinates(position.get("endCoordinates"), start))
+        rotations.append(placement.get("rotation", 0))
+
+    container_records = np.zeros(len(container_ids), dtype=CONTAINER_DTYPE)
+    if container_ids:
+        container_records["id"] = container_ids
+        container_records["zone"] = zones
+        container_records["size"] = sizes
+
+    item_records = np.zeros(len(item_ids), dtype=ITEM_DTYPE)
+    if item_ids:
+        item_records["id"] = item_ids
+        item_records["container"] = item_containers
+        item_records["start"] = starts
+        item_records["end"] = ends
+        item_records["rotation"] = rotations
+
+    string_section, string_bytes = strings.encode()
+    header = ARRANGEMENT_HEADER.pack(
+        ARRANGEMENT_MAGIC, ARRANGEMENT_VERSION, 0,
+        len(strings.index), len(container_records), len(item_records), string_bytes
+    )
+    return b"".join((header, string_section, container_records.tobytes(), item_records.tobytes()))
@@ -1,39 +1,51 @@
-from pymongo import MongoClient
+from pymongo import AsyncMongoClient
 from dotenv import load_dotenv
+import asyncio
 import os
 
 load_dotenv()  # Load variables from .env
 
 MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017")
-client = MongoClient(MONGO_URI)
+# The async client connects lazily, so creating it here does not block the import
+client = AsyncMongoClient(MONGO_URI)
 db = client["stellar_stash"]
 
 items_collection = db["items"]
 containers_collection = db["containers"]
 logs_collection = db["logs"]  # Add logs collection
+log_dead_letters_collection = db["log_dead_letters"]  # Log entries the logs collection rejected
+log_rollups_collection = db["log_rollups"]  # Daily log counts per action type, user and item
 placements_collection = db["placements"]
+import_jobs_collection = db["import_jobs"]
+placement_tombstones_collection = db["placement_tombstones"]  # Items removed from the arrangement, for incremental exports
+counters_collection = db["counters"]
+locks_collection = db["locks"]  # Leases that keep background jobs to one process at a time
 
 # Test the connection but don't close it
-try:
-    client.admin.command('ping')
-    print("Connected to MongoDB")
-except Exception as e:
-    print("Error connecting to MongoDB: ", str(e))
+async def ping():
+    try:
+        await client.admin.command('ping')
+        print("Connected to MongoDB")
+    except Exception as e:
+        print("Error connecting to MongoDB: ", str(e))
 
 # Example functions that should only run when this file is executed directly
-def get_items():
+async def get_items():
     try:
-        items = items_collection.find()
-        for item in items:
+        async for item in items_collection.find():
             print(item)
     except Exception as e:
         print("Error fetching items: ", str(e))
 
-def close_client():
-    client.close()
+async def close_client():
+    await client.close()
     print("MongoDB connection closed")
 
+async def main():
+    await ping()
+    await get_items()
+    await close_client()
+
 # Only run these functions when db.py is executed directly
 if __name__ == "__main__":
-    get_items()
-    close_client()
\ No newline at end of file
+    asyncio.run(main())
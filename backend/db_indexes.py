@@ -0,0 +1,120 @@
+from typing import Dict, List
+from pymongo import ASCENDING, IndexModel
+from pymongo.errors import OperationFailure
+from db import db
+
+# Server error codes for an existing index with the same name but a different definition
+INDEX_CONFLICT_CODES = (85, 86)  # IndexOptionsConflict, IndexKeySpecsConflict
+
+# Indexes required by the hot query paths, per collection.
+# Names are fixed so the startup check can tell declared indexes from ad-hoc ones.
+REQUIRED_INDEXES: Dict[str, List[IndexModel]] = {
+    "items": [
+        # Partial, since items created through /items have no itemId
+        IndexModel([("itemId", ASCENDING)], name="itemId_unique", unique=True, partialFilterExpression={"itemId": {"$exists": True}}),
+        IndexModel([("name", ASCENDING)], name="name"),
+        IndexModel([("preferredZone", ASCENDING)], name="preferredZone"),
+        # Waste identification finds expired and used-up items through these
+        IndexModel([("expiryAt", ASCENDING)], name="expiryAt"),
+        IndexModel([("remainingUses", ASCENDING)], name="remainingUses"),
+    ],
+    "containers": [
+        IndexModel([("containerId", ASCENDING)], name="containerId_unique", unique=True, partialFilterExpression={"containerId": {"$exists": True}}),
+        IndexModel([("zone", ASCENDING)], name="zone"),
+    ],
+    "placements": [
+        IndexModel([("itemId", ASCENDING)], name="itemId_unique", unique=True),
+        IndexModel([("containerId", ASCENDING)], name="containerId"),
+        # Search finds the items in front of an item through this
+        IndexModel([("containerId", ASCENDING), ("position.startCoordinates.depth", ASCENDING)], name="containerId_depth"),
+        IndexModel([("seq", ASCENDING)], name="seq"),
+        IndexModel([("updatedAt", ASCENDING)], name="updatedAt"),
+    ],
+    "placement_tombstones": [
+        IndexModel([("itemId", ASCENDING)], name="itemId_unique", unique=True),
+        IndexModel([("seq", ASCENDING)], name="seq"),
+        IndexModel([("removedAt", ASCENDING)], name="removedAt"),
+    ],
+    "import_jobs": [
+        IndexModel([("jobId", ASCENDING)], name="jobId_unique", unique=True),
+        IndexModel([("status", ASCENDING)], name="status"),
+    ],
+    "logs": [
+        # Every log query pages in (timestamp, _id) order, so _id ends each key
+        IndexModel([("timestamp", ASCENDING), ("_id", ASCENDING)], name="timestamp_id"),
+        IndexModel([("itemId", ASCENDING), ("timestamp", ASCENDING), ("_id", ASCENDING)], name="itemId_timestamp_id"),
+        IndexModel([("userId", ASCENDING), ("timestamp", ASCENDING), ("_id", ASCENDING)], name="userId_timestamp_id"),
+        IndexModel([("actionType", ASCENDING), ("timestamp", ASCENDING), ("_id", ASCENDING)], name="actionType_timestamp_id"),
+    ],
+    "log_rollups": [
+        IndexModel(
+            [("day", ASCENDING), ("actionType", ASCENDING), ("userId", ASCENDING), ("itemId", ASCENDING)],
+            name="day_actionType_userId_itemId_unique",
+            unique=True
+        ),
+        IndexModel([("actionType", ASCENDING), ("day", ASCENDING)], name="actionType_day"),
+        IndexModel([("userId", ASCENDING), ("day", ASCENDING)], name="userId_day"),
+        IndexModel([("itemId", ASCENDING), ("day", ASCENDING)], name="itemId_day"),
+    ],
+}
+
+async def ensure_indexes() -> Dict[str, List[str]]:
+    """
+    Create every required index that does not exist yet
+
+    Creating an index that already exists with the same definition is a
+    no-op, so this is safe to run on every startup. An existing index whose
+    definition changed is dropped and built again. An index that cannot be
+    built (for example a unique index over duplicate data) is reported and
+    skipped instead of stopping the others.
+
+    Returns:
+        Dictionary of collection name to the index names that failed to build
+    """
+    failures = {}
+    for collection_name, models in REQUIRED_INDEXES.items():
+        for model in models:
+            name = model.document["name"]
+            try:
+                try:
+                    await db[collection_name].create_indexes([model])
+                except OperationFailure as e:
+                    if e.code not in INDEX_CONFLICT_CODES:
+                        raise
+                    print(f"Rebuilding index {collection_name}.{name} with its new definition")
+                    await db[collection_name].drop_index(name)
+                    await db[collection_name].create_indexes([model])
+            except OperationFailure as e:
+                print(f"Could not create index {collection_name}.{name}: {str(e)}")
+                failures.setdefault(collection_name, []).append(name)
+    return failures
+
+async def index_report() -> Dict[str, Dict[str, List[str]]]:
+    """
+    Compare the declared indexes with what the database actually has
+
+    Returns:
+        Per collection, the declared indexes that are missing and the
+        existing indexes that have not served a single operation since the
+        server started
+    """
+    report = {}
+    for collection_name, models in REQUIRED_INDEXES.items():
+        collection = db[collection_name]
+        existing = set()
+        async for index in await collection.list_indexes():
+            existing.add(index["name"])
+
+        unused = []
+        try:
+            async for stats in await collection.aggregate([{"$indexStats": {}}]):
+                if stats["name"] != "_id_" and stats["accesses"]["ops"] == 0:
+                    unused.append(stats["name"])
+        except OperationFailure as e:
+            print(f"Could not read index usage for {collection_name}: {str(e)}")
+
+        report[collection_name] = {
+            "missing": [model.document["name"] for model in models if model.document["name"] not in existing],
+            "unused": sorted(unused),
+        }
+    return report
@@ -0,0 +1,73 @@
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Optional
+
+# Worker processes for CPU-bound algorithms (placement, waste, simulation, CSV parsing)
+CPU_POOL_WORKERS = int(os.getenv("CPU_POOL_WORKERS", str(os.cpu_count() or 2)))
+# Jobs allowed to wait for or run on the pool before new ones are turned away
+CPU_POOL_MAX_PENDING = int(os.getenv("CPU_POOL_MAX_PENDING", str(CPU_POOL_WORKERS * 4)))
+
+_cpu_pool: Optional[ProcessPoolExecutor] = None
+_pending_jobs = 0
+
+class ExecutorBusyError(Exception):
+    """Raised when the CPU pool already has CPU_POOL_MAX_PENDING jobs queued"""
+
+def _warm_up() -> bool:
+    # Importing the algorithm modules here pays their import cost before the first real job
+    import algorithms, import_algorithms, simulation_algorithms, waste_algorithms  # noqa: F401
+    return True
+
+def get_cpu_pool() -> ProcessPoolExecutor:
+    """Return the shared CPU pool, creating it on first use"""
+    global _cpu_pool
+    if _cpu_pool is None:
+        # Spawned workers start clean instead of inheriting the parent's MongoDB client and event loop
+        _cpu_pool = ProcessPoolExecutor(
+            max_workers=CPU_POOL_WORKERS,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+    return _cpu_pool
+
+def start_executors() -> None:
+    """Create the CPU pool and start every worker process ahead of the first request"""
+    pool = get_cpu_pool()
+    for future in [pool.submit(_warm_up) for _ in range(CPU_POOL_WORKERS)]:
+        future.result()
+    print(f"CPU pool started with {CPU_POOL_WORKERS} workers")
+
+def shutdown_executors() -> None:
+    global _cpu_pool
+    if _cpu_pool is not None:
+        _cpu_pool.shutdown(wait=True)
+        _cpu_pool = None
+
+def pending_jobs() -> int:
+    return _pending_jobs
+
+async def run_cpu_bound(func: Callable[..., Any], *args: Any) -> Any:
+    """
+    Run a CPU-bound function on the shared pool without blocking the event loop
+
+    Args:
+        func: Module-level function to run, it and its arguments must be picklable
+        *args: Positional arguments for the function
+
+    Returns:
+        The function's return value
+
+    Raises:
+        ExecutorBusyError: If the pool's queue is already full
+    """
+    global _pending_jobs
+    if _pending_jobs >= CPU_POOL_MAX_PENDING:
+        raise ExecutorBusyError(f"CPU pool is busy with {_pending_jobs} pending jobs")
+
+    _pending_jobs += 1
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(get_cpu_pool(), func, *args)
+    finally:
+        _pending_jobs -= 1
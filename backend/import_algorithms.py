@@ -1,73 +1,168 @@
 import csv
+import codecs
+import hashlib
 import io
-from typing import List, Dict, Any, Tuple
+import json
+import os
+from typing import List, Dict, Any, Tuple, Optional, AsyncIterator, Awaitable, Callable
 from models import ImportError, ImportResponse
+from item_fields import normalized_fields
 
-def import_items_algorithm(content_str: str) -> Tuple[ImportResponse, List[Dict[str, Any]]]:
+# Required fields for an item
+ITEM_REQUIRED_FIELDS = [
+    "itemId", "name", "width", "depth", "height",
+    "priority", "expiryDate", "usageLimit", "preferredZone"
+]
+
+# Required fields for a container
+CONTAINER_REQUIRED_FIELDS = [
+    "containerId", "zone", "width", "depth", "height"
+]
+
+# Longest CSV record stream_csv_rows assembles before giving up on it
+MAX_CSV_RECORD_CHARS = int(os.getenv("IMPORT_MAX_RECORD_CHARS", str(1 << 20)))
+# Key of the only field of a row stream_csv_rows could not parse; its value is the reason
+CSV_ERROR_FIELD = "__csv_error__"
+
+def validate_item_row(row: Dict[str, Any], row_num: int) -> Tuple[Optional[Dict[str, Any]], Optional[ImportError]]:
     """
-    Algorithm to import items from a CSV file
-    
+    Validate and convert one item row
+
     Args:
-        content_str: CSV content as a string
-        
+        row: Row as read by csv.DictReader
+        row_num: 1-based row number used in error messages
+
     Returns:
-        ImportResponse with import results
+        Tuple of (converted row, None) or (None, ImportError)
+    """
+    try:
+        # Check if all required fields are present
+        missing_fields = [field for field in ITEM_REQUIRED_FIELDS if field not in row or not row[field]]
+        if missing_fields:
+            return None, ImportError(
+                row=row_num,
+                message=f"Missing required fields: {', '.join(missing_fields)}"
+            )
+
+        # Convert numeric fields
+        try:
+            row['width'] = int(row['width'])
+            row['depth'] = int(row['depth'])
+            row['height'] = int(row['height'])
+            row['priority'] = int(row['priority'])
+        except ValueError:
+            return None, ImportError(
+                row=row_num,
+                message="Width, depth, height, and priority must be valid numbers"
+            )
+
+        # Store typed usage limit, expiry, volume and weight next to the text columns
+        row.update(normalized_fields(row))
+
+        return row, None
+
+    except Exception as e:
+        return None, ImportError(
+            row=row_num,
+            message=f"Error processing row: {str(e)}"
+        )
+
+def validate_container_row(row: Dict[str, Any], row_num: int) -> Tuple[Optional[Dict[str, Any]], Optional[ImportError]]:
     """
+    Validate and convert one container row
+
+    Args:
+        row: Row as read by csv.DictReader
+        row_num: 1-based row number used in error messages
+
+    Returns:
+        Tuple of (converted row, None) or (None, ImportError)
+    """
+    try:
+        # Check if all required fields are present
+        missing_fields = [field for field in CONTAINER_REQUIRED_FIELDS if field not in row or not row[field]]
+        if missing_fields:
+            return None, ImportError(
+                row=row_num,
+                message=f"Missing required fields: {', '.join(missing_fields)}"
+            )
+
+        # Convert numeric fields
+        try:
+            row['width'] = int(row['width'])
+            row['depth'] = int(row['depth'])
+            row['height'] = int(row['height'])
+        except ValueError:
+            return None, ImportError(
+                row=row_num,
+                message="Width, depth, and height must be valid numbers"
+            )
+
+        return row, None
+
+    except Exception as e:
+        return None, ImportError(
+            row=row_num,
+            message=f"Error processing row: {str(e)}"
+        )
+
+def row_content_hash(row: Dict[str, Any]) -> str:
+    """
+    Hash the converted fields of a row
+
+    Keys are sorted so the hash does not depend on the column order of the file.
+    """
+    content = json.dumps(row, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.blake2b(content.encode("utf-8"), digest_size=16).hexdigest()
+
+ROW_VALIDATORS = {
+    "items": validate_item_row,
+    "containers": validate_container_row,
+}
+
+def validate_rows(
+    kind: str,
+    rows: List[Dict[str, Any]],
+    first_row: int
+) -> Tuple[List[Dict[str, Any]], List[ImportError]]:
+    """
+    Validate a batch of consecutive rows
+
+    Args:
+        kind: "items" or "containers"
+        rows: Rows as read by csv.DictReader
+        first_row: Row number of the first row in the batch
+
+    Returns:
+        Tuple of (accepted rows with their contentHash, errors) in row order
+    """
+    validate = ROW_VALIDATORS[kind]
+    accepted = []
+    errors = []
+    for row_num, row in enumerate(rows, start=first_row):
+        if CSV_ERROR_FIELD in row:
+            errors.append(ImportError(row=row_num, message=row[CSV_ERROR_FIELD]))
+            continue
+        parsed, error = validate(row, row_num)
+        if error:
+            errors.append(error)
+        else:
+            parsed["contentHash"] = row_content_hash(parsed)
+            accepted.append(parsed)
+    return accepted, errors
+
+def _import_algorithm(kind: str, content_str: str) -> Tuple[ImportResponse, List[Dict[str, Any]]]:
     try:
         # Parse the CSV content
         csv_reader = csv.DictReader(io.StringIO(content_str))
-        
-        imported_count = 0
-        errors = []
-        parsed_items = []
-        
-        # Required fields for an item
-        required_fields = [
-            "itemId", "name", "width", "depth", "height", 
-            "priority", "expiryDate", "usageLimit", "preferredZone"
-        ]
-        
-        # Process each row in the CSV
-        for row_num, row in enumerate(csv_reader, start=1):
-            try:
-                # Check if all required fields are present
-                missing_fields = [field for field in required_fields if field not in row or not row[field]]
-                if missing_fields:
-                    errors.append(ImportError(
-                        row=row_num,
-                        message=f"Missing required fields: {', '.join(missing_fields)}"
-                    ))
-                    continue
-                
-                # Convert numeric fields
-                try:
-                    row['width'] = int(row['width'])
-                    row['depth'] = int(row['depth'])
-                    row['height'] = int(row['height'])
-                    row['priority'] = int(row['priority'])
-                except ValueError:
-                    errors.append(ImportError(
-                        row=row_num,
-                        message="Width, depth, height, and priority must be valid numbers"
-                    ))
-                    continue
-                
-                # Add the validated row to our parsed items
-                parsed_items.append(row)
-                imported_count += 1
-                
-            except Exception as e:
-                errors.append(ImportError(
-                    row=row_num,
-                    message=f"Error processing row: {str(e)}"
-                ))
-        
+        parsed, errors = validate_rows(kind, list(csv_reader), 1)
+
         return ImportResponse(
             success=True,
-            itemsImported=imported_count,
+            itemsImported=len(parsed),
             errors=errors
-        ), parsed_items
-        
+        ), parsed
+
     except Exception as e:
         return ImportResponse(
             success=False,
@@ -75,72 +170,112 @@ def import_items_algorithm(content_str: str) -> Tuple[ImportResponse, List[Dict[
             errors=[ImportError(row=0, message=f"Error processing file: {str(e)}")]
         ), []
 
+def import_items_algorithm(content_str: str) -> Tuple[ImportResponse, List[Dict[str, Any]]]:
+    """
+    Algorithm to import items from a CSV file
+
+    Args:
+        content_str: CSV content as a string
+
+    Returns:
+        Tuple of (ImportResponse with import results, List of parsed items)
+    """
+    return _import_algorithm("items", content_str)
+
 def import_containers_algorithm(content_str: str) -> Tuple[ImportResponse, List[Dict[str, Any]]]:
     """
     Algorithm to import containers from a CSV file
-    
+
     Args:
         content_str: CSV content as a string
-        
+
     Returns:
         Tuple of (ImportResponse with import results, List of parsed containers)
     """
-    try:
-        # Parse the CSV content
-        csv_reader = csv.DictReader(io.StringIO(content_str))
-        
-        imported_count = 0
-        errors = []
-        parsed_containers = []
-        
-        # Required fields for a container
-        required_fields = [
-            "containerId", "zone", "width", "depth", "height"
-        ]
-        
-        # Process each row in the CSV
-        for row_num, row in enumerate(csv_reader, start=1):
-            try:
-                # Check if all required fields are present
-                missing_fields = [field for field in required_fields if field not in row or not row[field]]
-                if missing_fields:
-                    errors.append(ImportError(
-                        row=row_num,
-                        message=f"Missing required fields: {', '.join(missing_fields)}"
-                    ))
-                    continue
-                
-                # Convert numeric fields
-                try:
-                    row['width'] = int(row['width'])
-                    row['depth'] = int(row['depth'])
-                    row['height'] = int(row['height'])
-                except ValueError:
-                    errors.append(ImportError(
-                        row=row_num,
-                        message="Width, depth, and height must be valid numbers"
-                    ))
-                    continue
-                
-                # Add the validated row to our parsed containers
-                parsed_containers.append(row)
-                imported_count += 1
-                
-            except Exception as e:
-                errors.append(ImportError(
-                    row=row_num,
-                    message=f"Error processing row: {str(e)}"
-                ))
-        
-        return ImportResponse(
-            success=True,
-            itemsImported=imported_count,
-            errors=errors
-        ), parsed_containers
-        
-    except Exception as e:
-        return ImportResponse(
-            success=False,
-            itemsImported=0,
-            errors=[ImportError(row=0, message=f"Error processing file: {str(e)}")]
-        ), []
\ No newline at end of file
+    return _import_algorithm("containers", content_str)
+
+async def stream_csv_rows(
+    read_chunk: Callable[[int], Awaitable[bytes]],
+    chunk_size: int = 1 << 20,
+    encoding: str = "utf-8-sig",
+    max_record_chars: int = MAX_CSV_RECORD_CHARS
+) -> AsyncIterator[Dict[str, str]]:
+    """
+    Parse a CSV upload incrementally, one chunk at a time
+
+    Only one chunk and the lines of the record being assembled are held in
+    memory. A record is complete once it has an even number of quote
+    characters, so quoted fields spanning several lines are kept together;
+    the parity is updated line by line instead of recounting the record.
+
+    A record that grows past max_record_chars, or that is still inside a
+    quoted field at the end of the file, is not parsed. It is yielded as a
+    row holding only CSV_ERROR_FIELD with the reason, which validate_rows
+    reports as an error for that row. Parsing resumes at the next line.
+
+    Args:
+        read_chunk: Coroutine function returning up to n bytes, b"" at the end
+        chunk_size: Number of bytes to read at a time
+        encoding: Text encoding of the upload; the default also drops a leading byte order mark
+        max_record_chars: Longest record accepted, so one bad quote cannot buffer the whole upload
+
+    Yields:
+        Rows as dictionaries keyed by the header fields
+    """
+    decoder = codecs.getincrementaldecoder(encoding)()
+    header = None
+    pending = ""      # Text after the last newline of the previous chunk
+    record = []       # Lines of a record whose quotes are not balanced yet
+    record_chars = 0
+    in_quotes = False
+    skipping = False  # Dropping the rest of a line that was too long
+
+    def parse(text: str):
+        return next(csv.reader([text]), [])
+
+    def too_long() -> Dict[str, str]:
+        return {CSV_ERROR_FIELD: f"Record is longer than {max_record_chars} characters, check for an unterminated quote"}
+
+    while True:
+        chunk = await read_chunk(chunk_size)
+        text = pending + decoder.decode(chunk, final=not chunk)
+        lines = text.split("\n")
+        pending = lines.pop() if chunk else ""
+        if not chunk and lines and lines[-1] == "":
+            lines.pop()
+
+        if skipping and lines:
+            # The end of the overlong line, already reported
+            lines.pop(0)
+            skipping = False
+        for line in lines:
+            record.append(line)
+            record_chars += len(line) + 1
+            if line.count('"') % 2:
+                in_quotes = not in_quotes
+            if in_quotes:
+                if record_chars > max_record_chars:
+                    record, record_chars, in_quotes = [], 0, False
+                    yield too_long()
+                continue
+            fields = parse("\n".join(record).rstrip("\r\n"))
+            record, record_chars = [], 0
+            if not fields:
+                continue
+            if header is None:
+                header = fields
+                continue
+            yield dict(zip(header, fields + [""] * (len(header) - len(fields))))
+
+        if len(pending) > max_record_chars - record_chars:
+            # A line with no newline in sight; report it once and drop it as it streams in
+            pending = ""
+            if not skipping:
+                skipping = True
+                record, record_chars, in_quotes = [], 0, False
+                yield too_long()
+
+        if not chunk:
+            if record:
+                yield {CSV_ERROR_FIELD: "Quoted field is not closed before the end of the file"}
+            break
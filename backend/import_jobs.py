@@ -0,0 +1,208 @@
+import asyncio
+import os
+import time
+import uuid
+from datetime import datetime
+from typing import Dict, List, Optional
+from fastapi import UploadFile
+from db import import_jobs_collection
+from models import ImportError, ImportJobStatus
+from import_pipeline import stream_import, IMPORT_BATCH_SIZE
+
+# Uploads are spooled here so a worker, or a resumed job after a restart, can re-read them
+IMPORT_SPOOL_DIR = os.getenv("IMPORT_SPOOL_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "import_spool"))
+# Import jobs allowed to run at the same time, the rest wait in the queue
+IMPORT_JOB_WORKERS = int(os.getenv("IMPORT_JOB_WORKERS", "2"))
+# Row errors kept on a job document
+MAX_JOB_ERRORS = 1000
+
+SPOOL_CHUNK_SIZE = 1 << 20
+
+_job_slots: Optional[asyncio.Semaphore] = None
+_running: Dict[str, asyncio.Task] = {}
+
+def _slots() -> asyncio.Semaphore:
+    # Created lazily so it belongs to the running event loop
+    global _job_slots
+    if _job_slots is None:
+        _job_slots = asyncio.Semaphore(IMPORT_JOB_WORKERS)
+    return _job_slots
+
+def job_status(job: Dict) -> ImportJobStatus:
+    """Convert a job document to the status returned by the API"""
+    return ImportJobStatus(
+        jobId=job["jobId"],
+        kind=job["kind"],
+        status=job["status"],
+        rowsParsed=job.get("rowsParsed", 0),
+        rowsImported=job.get("rowsImported", 0),
+        rowsRejected=job.get("rowsRejected", 0),
+        inserted=job.get("inserted", 0),
+        updated=job.get("updated", 0),
+        unchanged=job.get("unchanged", 0),
+        committedRows=job.get("committedRows", 0),
+        rowsPerSecond=job.get("rowsPerSecond", 0.0),
+        createdAt=job["createdAt"].isoformat(),
+        finishedAt=job["finishedAt"].isoformat() if job.get("finishedAt") else None,
+        message=job.get("message"),
+        errors=[ImportError(**error) for error in job.get("errors", [])]
+    )
+
+async def create_import_job(kind: str, file: UploadFile, batch_size: Optional[int] = None) -> ImportJobStatus:
+    """
+    Spool an upload to disk and queue it as a background import job
+
+    Args:
+        kind: "items" or "containers"
+        file: The uploaded CSV file
+        batch_size: Rows per validation and write batch
+
+    Returns:
+        Status of the queued job
+    """
+    job_id = str(uuid.uuid4())
+    os.makedirs(IMPORT_SPOOL_DIR, exist_ok=True)
+    path = os.path.join(IMPORT_SPOOL_DIR, f"{job_id}.csv")
+
+    with open(path, "wb") as spool:
+        while True:
+            chunk = await file.read(SPOOL_CHUNK_SIZE)
+            if not chunk:
+                break
+            await asyncio.to_thread(spool.write, chunk)
+
+    job = {
+        "jobId": job_id,
+        "kind": kind,
+        "status": "queued",
+        "path": path,
+        "fileName": file.filename,
+        "batchSize": batch_size or IMPORT_BATCH_SIZE,
+        "rowsParsed": 0,
+        "rowsImported": 0,
+        "rowsRejected": 0,
+        "inserted": 0,
+        "updated": 0,
+        "unchanged": 0,
+        "committedRows": 0,
+        "rowsPerSecond": 0.0,
+        "errors": [],
+        "createdAt": datetime.now(),
+        "finishedAt": None,
+    }
+    await import_jobs_collection.insert_one(job)
+    start_import_job(job_id)
+    return job_status(job)
+
+def start_import_job(job_id: str) -> None:
+    """Run a queued or interrupted job in the background, unless it is already running"""
+    if job_id in _running:
+        return
+    task = asyncio.create_task(run_import_job(job_id))
+    _running[job_id] = task
+    task.add_done_callback(lambda _: _running.pop(job_id, None))
+
+async def run_import_job(job_id: str) -> None:
+    """
+    Import a spooled upload, checkpointing after every committed batch
+
+    The checkpoint is the number of rows whose batch has been written. A
+    resumed job skips those rows and carries on from the next batch; the
+    writes are upserts, so a batch replayed after a crash mid-write is
+    harmless.
+    """
+    async with _slots():
+        job = await import_jobs_collection.find_one({"jobId": job_id})
+        if not job or job["status"] == "completed":
+            return
+
+        start_row = job.get("committedRows", 0) + 1
+        started = time.monotonic()
+        await import_jobs_collection.update_one(
+            {"jobId": job_id},
+            {"$set": {"status": "running", "message": None}}
+        )
+
+        async def checkpoint(committed_row: int, parsed_row: int, counts: Dict[str, int], batch_errors: List[ImportError]) -> None:
+            elapsed = time.monotonic() - started
+            await import_jobs_collection.update_one(
+                {"jobId": job_id},
+                {
+                    "$set": {
+                        "committedRows": committed_row,
+                        "rowsParsed": parsed_row,
+                        "rowsPerSecond": round((committed_row - start_row + 1) / elapsed, 1) if elapsed > 0 else 0.0,
+                    },
+                    "$inc": {
+                        "rowsImported": counts["imported"],
+                        "rowsRejected": len(batch_errors),
+                        "inserted": counts["inserted"],
+                        "updated": counts["updated"],
+                        "unchanged": counts["unchanged"],
+                    },
+                    "$push": {"errors": {"$each": [error.dict() for error in batch_errors], "$slice": MAX_JOB_ERRORS}},
+                }
+            )
+
+        try:
+            with open(job["path"], "rb") as spool:
+                async def read_chunk(n: int) -> bytes:
+                    return await asyncio.to_thread(spool.read, n)
+
+                await stream_import(job["kind"], read_chunk, job["batchSize"], start_row, checkpoint)
+
+            await import_jobs_collection.update_one(
+                {"jobId": job_id},
+                {"$set": {"status": "completed", "finishedAt": datetime.now()}}
+            )
+            os.remove(job["path"])
+        except Exception as e:
+            # The spool file is kept so the job can be resumed from its last checkpoint
+            print(f"Import job {job_id} failed: {str(e)}")
+            await import_jobs_collection.update_one(
+                {"jobId": job_id},
+                {"$set": {"status": "failed", "message": str(e), "finishedAt": datetime.now()}}
+            )
+
+async def get_import_job(job_id: str) -> Optional[ImportJobStatus]:
+    job = await import_jobs_collection.find_one({"jobId": job_id})
+    return job_status(job) if job else None
+
+async def resume_import_job(job_id: str) -> Optional[ImportJobStatus]:
+    """
+    Restart a failed job from its last checkpoint
+
+    Returns:
+        Status of the job, or None if it does not exist
+    """
+    job = await import_jobs_collection.find_one({"jobId": job_id})
+    if not job:
+        return None
+    if job["status"] == "failed" and os.path.exists(job["path"]):
+        await import_jobs_collection.update_one(
+            {"jobId": job_id},
+            {"$set": {"status": "queued", "finishedAt": None}}
+        )
+        job["status"] = "queued"
+        job["finishedAt"] = None
+        start_import_job(job_id)
+    return job_status(job)
+
+async def resume_interrupted_jobs() -> int:
+    """
+    Requeue jobs left queued or running by a previous process
+
+    Returns:
+        Number of jobs requeued
+    """
+    resumed = 0
+    async for job in import_jobs_collection.find({"status": {"$in": ["queued", "running"]}}):
+        if os.path.exists(job["path"]):
+            start_import_job(job["jobId"])
+            resumed += 1
+        else:
+            await import_jobs_collection.update_one(
+                {"jobId": job["jobId"]},
+                {"$set": {"status": "failed", "message": "Spooled upload is missing", "finishedAt": datetime.now()}}
+            )
+    return resumed
@@ -0,0 +1,195 @@
+import asyncio
+import os
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+from db import items_collection, containers_collection
+from models import ImportError, ImportResponse
+from import_algorithms import stream_csv_rows, validate_rows
+from placement_store import bump_container_version
+from executors import run_cpu_bound, ExecutorBusyError, CPU_POOL_WORKERS, CPU_POOL_MAX_PENDING
+
+# Rows validated and written to MongoDB per bulk_write
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "1000"))
+# Errors kept in the response; the rest are only counted, so huge bad files stay bounded in memory
+MAX_REPORTED_ERRORS = 1000
+# Batches validated at the same time; they are still written in row order.
+# Never more than the CPU pool accepts, so an import cannot fill the pool's queue by itself.
+IMPORT_VALIDATION_WINDOW = max(1, min(
+    int(os.getenv("IMPORT_VALIDATION_WINDOW", str(CPU_POOL_WORKERS))),
+    CPU_POOL_MAX_PENDING
+))
+# Seconds to wait before resubmitting a batch the busy CPU pool turned away
+IMPORT_BUSY_RETRY_SECONDS = 0.05
+
+IMPORT_TARGETS = {
+    "items": (items_collection, "itemId"),
+    "containers": (containers_collection, "containerId"),
+}
+
+async def write_batch(kind: str, rows: List[Dict[str, Any]]) -> Dict[str, int]:
+    """
+    Write the new and changed rows of a batch with one unordered bulk_write
+
+    The stored contentHash of every key in the batch is read with a single
+    query; rows whose hash matches are skipped without a write.
+
+    Returns:
+        Dictionary with the number of rows imported, and the number of
+        distinct keys inserted, updated and left unchanged
+    """
+    collection, key = IMPORT_TARGETS[kind]
+    # The last row for a key wins, as it did with one write per row
+    latest = {row[key]: row for row in rows}
+    counts = {"imported": len(rows), "inserted": 0, "updated": 0, "unchanged": 0}
+    if not latest:
+        return counts
+
+    stored = {}
+    async for doc in collection.find({key: {"$in": list(latest)}}, {key: 1, "contentHash": 1, "remainingUses": 1, "_id": 0}):
+        stored[doc[key]] = doc
+
+    operations = []
+    kinds = []
+    for value, row in latest.items():
+        if value not in stored:
+            kinds.append("inserted")
+        elif stored[value].get("contentHash") != row["contentHash"]:
+            kinds.append("updated")
+        else:
+            counts["unchanged"] += 1
+            continue
+        update = {"$set": row}
+        if kind == "items":
+            limit = row["usageLimitUses"]
+            if value not in stored:
+                # New items start with every use left
+                update["$setOnInsert"] = {"remainingUses": limit}
+            elif limit is None or stored[value].get("remainingUses") is None:
+                # Became unlimited, or was unlimited or never counted before
+                update["$set"] = {**row, "remainingUses": limit}
+            else:
+                # Re-importing an item keeps its count, but never above a lowered limit
+                update["$min"] = {"remainingUses": limit}
+        operations.append(UpdateOne({key: value}, update, upsert=True))
+    if not operations:
+        return counts
+
+    failed = set()
+    try:
+        await collection.bulk_write(operations, ordered=False)
+    except BulkWriteError as e:
+        failed = {error["index"] for error in e.details.get("writeErrors", [])}
+        print(f"Bulk import of {kind} had {len(failed)} failed writes")
+    if kind == "containers" and len(failed) < len(operations):
+        await bump_container_version()
+    for i, outcome in enumerate(kinds):
+        if i not in failed:
+            counts[outcome] += 1
+    counts["imported"] -= len(failed)
+    return counts
+
+async def validate_batch(kind: str, rows: List[Dict[str, Any]], first_row: int) -> Tuple[List[Dict[str, Any]], List[ImportError]]:
+    """
+    Validate a batch on the CPU pool, waiting while the pool is busy
+
+    Requests are turned away by a full pool so they can answer 503, but an
+    import has nobody to answer to and waits for a free slot instead.
+    """
+    while True:
+        try:
+            return await run_cpu_bound(validate_rows, kind, rows, first_row)
+        except ExecutorBusyError:
+            await asyncio.sleep(IMPORT_BUSY_RETRY_SECONDS)
+
+async def stream_import(
+    kind: str,
+    read_chunk: Callable[[int], Awaitable[bytes]],
+    batch_size: int = IMPORT_BATCH_SIZE,
+    start_row: int = 1,
+    on_batch: Optional[Callable[[int, int, Dict[str, int], List[ImportError]], Awaitable[None]]] = None
+) -> ImportResponse:
+    """
+    Import a CSV upload as a stream of batches
+
+    Rows are parsed as chunks are read and cut into row ranges. Up to
+    IMPORT_VALIDATION_WINDOW ranges are validated on the CPU pool at once
+    while parsing carries on, and each range is upserted with one bulk_write
+    in row order, so row numbers, errors and checkpoints come out exactly as
+    with one range at a time. Memory use depends on the batch size and the
+    window, not on the size of the upload.
+
+    Args:
+        kind: "items" or "containers"
+        read_chunk: Coroutine function returning up to n bytes of the upload, b"" at the end
+        batch_size: Rows per validation and write batch
+        start_row: First row to import; earlier rows are parsed but skipped, used to resume
+        on_batch: Optional coroutine called after each committed batch with
+            (last committed row number, last parsed row number, write_batch counts, batch errors);
+            parsing runs ahead of the commits by up to IMPORT_VALIDATION_WINDOW batches
+
+    Returns:
+        ImportResponse with the rows imported, the insert/update/unchanged
+        counts and the row errors
+    """
+    totals = {"imported": 0, "inserted": 0, "updated": 0, "unchanged": 0}
+    errors: List[ImportError] = []
+    error_count = 0
+    batch: List[Dict[str, Any]] = []
+    next_row = 1
+    skipped = 0
+    # (last row of the range, validation task) in row order
+    in_flight: Deque[Tuple[int, asyncio.Future]] = deque()
+
+    def submit() -> None:
+        nonlocal next_row, batch
+        task = asyncio.ensure_future(validate_batch(kind, batch, next_row))
+        next_row += len(batch)
+        in_flight.append((next_row - 1, task))
+        batch = []
+
+    async def commit_oldest() -> None:
+        nonlocal error_count
+        last_row, task = in_flight.popleft()
+        accepted, batch_errors = await task
+        error_count += len(batch_errors)
+        errors.extend(batch_errors[:MAX_REPORTED_ERRORS - len(errors)])
+        counts = await write_batch(kind, accepted)
+        for name in totals:
+            totals[name] += counts[name]
+        if on_batch is not None:
+            # Rows up to next_row - 1 have been parsed, including those still being validated
+            await on_batch(last_row, next_row - 1, counts, batch_errors)
+
+    try:
+        async for row in stream_csv_rows(read_chunk):
+            if skipped < start_row - 1:
+                # Already committed by an earlier run of the same import
+                skipped += 1
+                next_row += 1
+                continue
+            batch.append(row)
+            if len(batch) >= batch_size:
+                submit()
+                if len(in_flight) >= IMPORT_VALIDATION_WINDOW:
+                    await commit_oldest()
+        if batch:
+            submit()
+        while in_flight:
+            await commit_oldest()
+    finally:
+        for _, task in in_flight:
+            task.cancel()
+
+    if error_count > len(errors):
+        errors.append(ImportError(row=0, message=f"{error_count - len(errors)} more row errors not shown"))
+
+    return ImportResponse(
+        success=True,
+        itemsImported=totals["imported"],
+        inserted=totals["inserted"],
+        updated=totals["updated"],
+        unchanged=totals["unchanged"],
+        errors=errors
+    )
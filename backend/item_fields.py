@@ -0,0 +1,67 @@
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+# Fields derived from the free-text CSV columns, stored on every item document
+NORMALIZED_FIELDS = ("usageLimitUses", "expiryAt", "volume", "weight")
+
+def parse_usage_limit(usage_limit: Any) -> Optional[int]:
+    """
+    Parse a usage limit such as "30 uses" or "30"
+
+    Returns:
+        Number of uses, or None for "N/A", "unlimited" and values that cannot be parsed
+    """
+    if not isinstance(usage_limit, str):
+        return usage_limit if isinstance(usage_limit, int) else None
+    limit_text = usage_limit.lower().strip()
+    if limit_text in ("n/a", "unlimited", ""):
+        return None
+    if "uses" in limit_text:
+        limit_text = limit_text.split("uses")[0].strip()
+    try:
+        return int(limit_text)
+    except ValueError:
+        return None
+
+def parse_expiry(expiry_date: Any) -> Optional[datetime]:
+    """
+    Parse a YYYY-MM-DD expiry date
+
+    Returns:
+        Midnight of the expiry day, stored by MongoDB as a BSON date, or None
+        for "N/A" and values that cannot be parsed
+    """
+    if isinstance(expiry_date, datetime):
+        return expiry_date
+    try:
+        return datetime.strptime(expiry_date, "%Y-%m-%d")
+    except (TypeError, ValueError):
+        return None
+
+def item_weight(volume: float) -> float:
+    """Estimated weight in kg: 1000 cubic cm is 1kg, kept between 0.1kg and 5kg"""
+    return max(0.1, min(5, volume / 1000))
+
+def normalized_fields(item: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Compute the typed fields the algorithms read instead of re-parsing text
+
+    Args:
+        item: Item document or validated CSV row
+
+    Returns:
+        Dictionary with usageLimitUses, expiryAt, volume and weight
+    """
+    volume = item.get("width", 0) * item.get("depth", 0) * item.get("height", 0)
+    return {
+        "usageLimitUses": parse_usage_limit(item.get("usageLimit", "N/A")),
+        "expiryAt": parse_expiry(item.get("expiryDate", "N/A")),
+        "volume": volume,
+        "weight": item_weight(volume),
+    }
+
+def with_normalized_fields(item: Dict[str, Any]) -> Dict[str, Any]:
+    """Return the item as is when it already has the normalized fields, else a copy with them added"""
+    if "volume" in item:
+        return item
+    return {**item, **normalized_fields(item)}
@@ -1,17 +1,159 @@
-from typing import List, Optional
-from db import logs_collection
+import asyncio
+import base64
+import json
+import os
+from itertools import islice
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+from bson import ObjectId
+from pymongo import ASCENDING
+from db import logs_collection, log_dead_letters_collection
 from models import LogEntry, LogResponse
+from log_writer import LogWriter
+from log_rollups import apply_log_rollups
+from log_archive import log_day, parse_log_timestamp, read_archived_page, read_archived_logs, segment_days, utc_now
 from datetime import datetime
 
-def get_logs_algorithm(
+# Shared buffered writer for the logs collection, started and stopped with the app.
+# Every written batch is also added to the daily rollup buckets.
+log_writer = LogWriter(logs_collection, on_write=apply_log_rollups, dead_letters=log_dead_letters_collection)
+
+# Logs returned per page when the caller does not ask for a page size
+LOG_PAGE_SIZE = int(os.getenv("LOG_PAGE_SIZE", "1000"))
+MAX_LOG_PAGE_SIZE = 10000
+# Logs fetched per cursor batch by the NDJSON stream
+LOG_STREAM_BATCH_SIZE = 5000
+
+VALID_ACTION_TYPES = ["placement", "retrieval", "rearrangement", "disposal"]
+
+def build_log_query(
     startDate: str,
     endDate: str,
     itemId: Optional[str] = None,
     userId: Optional[str] = None,
     actionType: Optional[str] = None
+) -> Optional[Dict[str, Any]]:
+    """
+    Build the MongoDB filter for a log query
+
+    Returns:
+        The filter, or None if the dates or the action type are invalid
+    """
+    # Validate date formats first
+    try:
+        # Timestamps are stored as BSON dates, so the range bounds must be dates too
+        start = parse_log_timestamp(startDate)
+        end = parse_log_timestamp(endDate)
+    except ValueError:
+        # Invalid date format
+        return None
+        
+    # Create the base query with date range
+    query = {
+        "timestamp": {
+            "$gte": start,
+            "$lte": end
+        }
+    }
+    
+    # Add optional filters if provided
+    if itemId:
+        query["itemId"] = itemId
+    
+    if userId:
+        query["userId"] = userId
+    
+    if actionType:
+        # Validate action type
+        if actionType not in VALID_ACTION_TYPES:
+            return None
+        query["actionType"] = actionType
+    else:
+        # Leave out the entity logs of the /items routes, which have no action type
+        query["actionType"] = {"$exists": True}
+    
+    return query
+
+def archive_filters(query: Dict[str, Any]) -> Tuple[Any, Any, Dict[str, str]]:
+    """
+    Split a build_log_query filter into the (start, end, exact-match filters) read by log_archive
+
+    The archive reader only returns logs with an action type, so the $exists
+    condition on it is not passed on.
+    """
+    filters = {
+        field: query[field] for field in ("itemId", "userId", "actionType")
+        if isinstance(query.get(field), str)
+    }
+    return query["timestamp"]["$gte"], query["timestamp"]["$lte"], filters
+
+def encode_log_cursor(log: Dict[str, Any], archived: bool = False) -> str:
+    """Opaque cursor pointing just after a log, in (timestamp, _id) order"""
+    timestamp = log["timestamp"]
+    key = {"id": str(log["_id"])}
+    if archived:
+        key["a"] = 1
+    if isinstance(timestamp, datetime):
+        key["d"] = timestamp.isoformat()
+    else:
+        key["t"] = timestamp
+    return base64.urlsafe_b64encode(json.dumps(key, separators=(",", ":")).encode("utf-8")).decode("ascii")
+
+def decode_log_cursor(cursor: str) -> Tuple[Any, ObjectId, bool]:
+    """
+    Read back a cursor made by encode_log_cursor
+
+    Returns:
+        Tuple of (timestamp, _id, whether the log is in the archive)
+
+    Raises:
+        ValueError: If the cursor was not produced by encode_log_cursor
+    """
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        timestamp = datetime.fromisoformat(key["d"]) if "d" in key else key["t"]
+        return timestamp, ObjectId(key["id"]), bool(key.get("a"))
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+def keyset_filter(timestamp: Any, log_id: ObjectId) -> Dict[str, Any]:
+    """Filter matching the logs after (timestamp, _id)"""
+    return {"$or": [
+        {"timestamp": {"$gt": timestamp}},
+        {"timestamp": timestamp, "_id": {"$gt": log_id}}
+    ]}
+
+def log_entry(log: Dict[str, Any]) -> LogEntry:
+    """
+    Convert a log document to a LogEntry model
+
+    Entity logs written by the /items routes (action, entity_id) are mapped
+    onto the same fields instead of failing.
+    """
+    timestamp = log["timestamp"]
+    return LogEntry(
+        timestamp=timestamp.isoformat() if isinstance(timestamp, datetime) else str(timestamp),
+        userId=log.get("userId") or "",
+        actionType=log.get("actionType") or log.get("action") or "",
+        itemId=log.get("itemId") or str(log.get("entity_id", "")),
+        details=log.get("details") if isinstance(log.get("details"), dict) else None
+    )
+
+async def get_logs_algorithm(
+    startDate: str,
+    endDate: str,
+    itemId: Optional[str] = None,
+    userId: Optional[str] = None,
+    actionType: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = None
 ) -> LogResponse:
     """
-    Algorithm to retrieve and filter logs from the database
+    Algorithm to retrieve and filter logs from the database, one page at a time
+    
+    Pages are read in (timestamp, _id) order with a keyset filter, so each page
+    costs an index range scan however deep into the results it is. Archived
+    logs are older than anything left in MongoDB, so a query reads the
+    archive segments first and continues into the collection.
     
     Args:
         startDate: Start date in ISO format
@@ -19,66 +161,60 @@ def get_logs_algorithm(
         itemId: Optional filter for specific item
         userId: Optional filter for specific user
         actionType: Optional filter for action type
+        cursor: Optional nextCursor of the previous page
+        limit: Optional page size, LOG_PAGE_SIZE if omitted
     
     Returns:
-        LogResponse object with filtered logs
+        LogResponse object with one page of filtered logs and the cursor of the next page
     """
     try:
-        # Validate date formats first
-        try:
-            # Test if dates are in valid ISO format by parsing them
-            datetime.fromisoformat(startDate.replace('Z', '+00:00'))
-            datetime.fromisoformat(endDate.replace('Z', '+00:00'))
-        except ValueError:
-            # Invalid date format
+        query = build_log_query(startDate, endDate, itemId, userId, actionType)
+        if query is None:
             return LogResponse(
                 success=False,
                 logs=[]
             )
-            
-        # Create the base query with date range
-        query = {
-            "timestamp": {
-                "$gte": startDate,
-                "$lte": endDate
-            }
-        }
         
-        # Add optional filters if provided
-        if itemId:
-            query["itemId"] = itemId
-        
-        if userId:
-            query["userId"] = userId
-        
-        if actionType:
-            # Validate action type
-            valid_action_types = ["placement", "retrieval", "rearrangement", "disposal"]
-            if actionType not in valid_action_types:
+        position = None
+        if cursor:
+            try:
+                position = decode_log_cursor(cursor)
+            except ValueError:
                 return LogResponse(
                     success=False,
                     logs=[]
                 )
-            query["actionType"] = actionType
         
-        # Fetch logs from the database
-        logs_data = list(logs_collection.find(query, {"_id": 0}))
+        page_size = min(limit or LOG_PAGE_SIZE, MAX_LOG_PAGE_SIZE)
         
-        # Convert database objects to LogEntry models
-        logs = []
-        for log in logs_data:
-            log_entry = LogEntry(
-                timestamp=log["timestamp"],
-                userId=log["userId"],
-                actionType=log["actionType"],
-                itemId=log["itemId"],
-                details=log.get("details")
+        # Fetch one more log than the page holds to know whether another page follows
+        archived = []
+        if position is None or position[2]:
+            start, end, filters = archive_filters(query)
+            archived = await asyncio.to_thread(
+                read_archived_page, start, end, filters, position[:2] if position else None, page_size + 1
             )
-            logs.append(log_entry)
+        
+        logs_data = []
+        if len(archived) <= page_size:
+            if position is not None and not position[2]:
+                query = {"$and": [query, keyset_filter(*position[:2])]}
+            
+            # Write buffered entries first so a query sees every action logged before it
+            await log_writer.flush()
+            
+            logs_data = await logs_collection.find(query).sort(
+                [("timestamp", ASCENDING), ("_id", ASCENDING)]
+            ).limit(page_size + 1 - len(archived)).to_list(None)
+        
+        page = (archived + logs_data)[:page_size + 1]
+        has_more = len(page) > page_size
+        page = page[:page_size]
         
         return LogResponse(
             success=True,
-            logs=logs
+            logs=[log_entry(log) for log in page],
+            nextCursor=encode_log_cursor(page[-1], archived=len(page) <= len(archived)) if has_more else None
         )
     
     except Exception as e:
@@ -88,35 +224,88 @@ def get_logs_algorithm(
             logs=[]
         )
 
-def log_action(
+async def stream_logs_ndjson(query: Dict[str, Any]) -> AsyncIterator[bytes]:
+    """
+    Yield every log matching a query as newline-delimited JSON
+
+    Archived logs come first, one day segment at a time, followed by the
+    logs still in MongoDB from a batched cursor, all in (timestamp, _id)
+    order. Each batch is encoded into one chunk, so memory use does not
+    depend on the width of the range.
+    """
+    start, end, filters = archive_filters(query)
+    for day in segment_days(log_day(start), log_day(end)):
+        # Pull one batch at a time from the segment, which decompresses one block at a time
+        archived = read_archived_logs(day, start, end, filters)
+        try:
+            while True:
+                batch = await asyncio.to_thread(lambda: list(islice(archived, LOG_STREAM_BATCH_SIZE)))
+                if not batch:
+                    break
+                yield ("\n".join(log_entry(log).json() for log in batch) + "\n").encode("utf-8")
+        finally:
+            archived.close()
+
+    await log_writer.flush()
+    cursor = logs_collection.find(query).sort(
+        [("timestamp", ASCENDING), ("_id", ASCENDING)]
+    ).batch_size(LOG_STREAM_BATCH_SIZE)
+    lines = []
+    try:
+        async for log in cursor:
+            lines.append(log_entry(log).json())
+            if len(lines) >= LOG_STREAM_BATCH_SIZE:
+                yield ("\n".join(lines) + "\n").encode("utf-8")
+                lines = []
+    except Exception as e:
+        # Headers are already sent, so the error can only end the stream early
+        print(f"Error streaming logs: {str(e)}")
+        raise
+    finally:
+        await cursor.close()
+    if lines:
+        yield ("\n".join(lines) + "\n").encode("utf-8")
+
+async def log_action(
     timestamp: str,
     userId: str,
     actionType: str,
     itemId: str,
-    details: dict = None
+    details: dict = None,
+    flush: bool = False
 ) -> bool:
     """
     Helper function to log an action to the database
     
+    The entry is buffered and written in a batch with other actions, see log_writer.
+    
     Args:
-        timestamp: Time when the action occurred
+        timestamp: Time when the action occurred, in ISO format; stored as a BSON date
         userId: ID of the user who performed the action
         actionType: Type of action (placement, retrieval, etc.)
         itemId: ID of the item involved
         details: Additional details about the action
+        flush: Wait until the entry is written, for callers that read it back right away
     
     Returns:
         Boolean indicating success or failure
     """
     try:
+        try:
+            logged_at = parse_log_timestamp(timestamp)
+        except ValueError:
+            # Keep the action, stamped with the time it was logged and the text it came with
+            print(f"Invalid log timestamp {timestamp!r}, using the current time")
+            logged_at = utc_now()
+            details = {**(details or {}), "timestampText": str(timestamp)}
         log_entry = {
-            "timestamp": timestamp,
+            "timestamp": logged_at,
             "userId": userId,
             "actionType": actionType,
             "itemId": itemId,
             "details": details or {}
         }
-        logs_collection.insert_one(log_entry)
+        await log_writer.add(log_entry, flush)
         return True
     except Exception as e:
         print(f"Error logging action: {str(e)}")
@@ -0,0 +1,328 @@
+import asyncio
+import mmap
+import os
+import socket
+import struct
+import tempfile
+import uuid
+import zlib
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+import bson
+from pymongo import ASCENDING
+from pymongo.errors import DuplicateKeyError
+from db import logs_collection, locks_collection
+
+# Logs older than this many days are moved out of MongoDB into segment files
+LOG_RETENTION_DAYS = int(os.getenv("LOG_RETENTION_DAYS", "90"))
+LOG_ARCHIVE_DIR = os.getenv("LOG_ARCHIVE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "log_archive"))
+# Hours between archival runs while the app is up
+LOG_ARCHIVE_INTERVAL_HOURS = float(os.getenv("LOG_ARCHIVE_INTERVAL_HOURS", "24"))
+# Logs per compressed block; a query decompresses only the blocks its range and filters touch
+SEGMENT_BLOCK_SIZE = 1000
+# Only the process holding this lease archives; it expires if that process dies mid-run
+ARCHIVER_LEASE = "log-archiver"
+LOG_ARCHIVE_LEASE_SECONDS = int(os.getenv("LOG_ARCHIVE_LEASE_SECONDS", "600"))
+
+# A segment holds one day of logs sorted by (timestamp, _id):
+#   zlib-compressed blocks of concatenated BSON documents,
+#   then a BSON index document listing every block,
+#   then the index offset as a little-endian uint64.
+SEGMENT_FOOTER = struct.Struct("<Q")
+SEGMENT_SUFFIX = ".seg"
+
+def log_day(timestamp: Any) -> str:
+    """
+    Day of a log timestamp as YYYY-MM-DD
+
+    Accepts BSON dates and ISO strings; strings that do not parse keep their first ten characters.
+    """
+    if isinstance(timestamp, datetime):
+        return timestamp.strftime("%Y-%m-%d")
+    try:
+        return datetime.fromisoformat(str(timestamp).replace('Z', '+00:00')).strftime("%Y-%m-%d")
+    except ValueError:
+        return str(timestamp)[:10]
+
+def parse_log_timestamp(timestamp: Any) -> datetime:
+    """
+    Convert an ISO timestamp to the naive UTC datetime MongoDB stores as a BSON date
+
+    Timestamps with an offset are converted to UTC; timestamps without one are taken as UTC.
+
+    Raises:
+        ValueError: If the timestamp is not in ISO format
+    """
+    if not isinstance(timestamp, datetime):
+        timestamp = datetime.fromisoformat(str(timestamp).replace('Z', '+00:00'))
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+    return timestamp
+
+def utc_now() -> datetime:
+    """Current time as a naive UTC datetime, like the stored log timestamps"""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+def _timestamp_key(timestamp: Any) -> datetime:
+    """Comparable form of a log timestamp, whether it is stored as a BSON date or an ISO string"""
+    try:
+        return parse_log_timestamp(timestamp)
+    except ValueError:
+        return datetime.min
+
+def log_sort_key(log: Dict[str, Any]) -> Tuple[datetime, Any]:
+    return _timestamp_key(log["timestamp"]), log["_id"]
+
+def segment_path(day: str) -> str:
+    return os.path.join(LOG_ARCHIVE_DIR, f"logs-{day}{SEGMENT_SUFFIX}")
+
+def segment_days(start_day: Optional[str] = None, end_day: Optional[str] = None) -> List[str]:
+    """Days with a segment file between two YYYY-MM-DD days, inclusive, oldest first"""
+    if not os.path.isdir(LOG_ARCHIVE_DIR):
+        return []
+    days = []
+    for name in os.listdir(LOG_ARCHIVE_DIR):
+        if name.startswith("logs-") and name.endswith(SEGMENT_SUFFIX):
+            day = name[len("logs-"):-len(SEGMENT_SUFFIX)]
+            if (start_day is None or day >= start_day) and (end_day is None or day <= end_day):
+                days.append(day)
+    return sorted(days)
+
+class LogSegment:
+    """A memory-mapped segment file"""
+
+    def __init__(self, path: str):
+        self.file = open(path, "rb")
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        (index_offset,) = SEGMENT_FOOTER.unpack_from(self.map, len(self.map) - SEGMENT_FOOTER.size)
+        self.blocks: List[Dict[str, Any]] = bson.decode(self.map[index_offset:len(self.map) - SEGMENT_FOOTER.size])["blocks"]
+
+    def read_block(self, block: Dict[str, Any]) -> List[Dict[str, Any]]:
+        return bson.decode_all(zlib.decompress(self.map[block["offset"]:block["offset"] + block["length"]]))
+
+    def read_all(self) -> List[Dict[str, Any]]:
+        return [log for block in self.blocks for log in self.read_block(block)]
+
+    def close(self) -> None:
+        self.map.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def read_segment(day: str) -> List[Dict[str, Any]]:
+    """Every archived log of one day"""
+    with LogSegment(segment_path(day)) as segment:
+        return segment.read_all()
+
+def write_segment(day: str, logs: List[Dict[str, Any]]) -> int:
+    """
+    Write one day of logs to its segment, merged with any logs already archived for that day
+
+    The segment is written to a temporary file and renamed into place, so
+    readers only ever see a complete segment.
+
+    Returns:
+        Number of logs in the segment
+    """
+    os.makedirs(LOG_ARCHIVE_DIR, exist_ok=True)
+    path = segment_path(day)
+    merged = {log["_id"]: log for log in logs}
+    if os.path.exists(path):
+        with LogSegment(path) as segment:
+            for log in segment.read_all():
+                merged.setdefault(log["_id"], log)
+    ordered = sorted(merged.values(), key=log_sort_key)
+
+    # A unique temporary name, so two writers of the same day never share a file
+    fd, temp_path = tempfile.mkstemp(prefix=f"logs-{day}-", suffix=".tmp", dir=LOG_ARCHIVE_DIR)
+    try:
+        with os.fdopen(fd, "wb") as out:
+            _write_blocks(out, day, ordered)
+            out.flush()
+            os.fsync(out.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+    return len(ordered)
+
+def _write_blocks(out, day: str, ordered: List[Dict[str, Any]]) -> None:
+    """Write the compressed blocks, the block index and the footer of a segment"""
+    blocks = []
+    offset = 0
+    for i in range(0, len(ordered), SEGMENT_BLOCK_SIZE):
+        chunk = ordered[i:i + SEGMENT_BLOCK_SIZE]
+        data = zlib.compress(b"".join(bson.encode(log) for log in chunk), 6)
+        out.write(data)
+        blocks.append({
+            "offset": offset,
+            "length": len(data),
+            "count": len(chunk),
+            "first": log_sort_key(chunk[0])[0],
+            "last": log_sort_key(chunk[-1])[0],
+            "actionTypes": sorted({str(log.get("actionType")) for log in chunk}),
+        })
+        offset += len(data)
+    out.write(bson.encode({"day": day, "blocks": blocks}))
+    out.write(SEGMENT_FOOTER.pack(offset))
+
+def read_archived_logs(
+    day: str,
+    start: Any,
+    end: Any,
+    filters: Dict[str, str],
+    after: Optional[Tuple[Any, Any]] = None
+) -> Iterator[Dict[str, Any]]:
+    """
+    Yield the archived logs of one day that match a range query, in (timestamp, _id) order
+
+    Blocks entirely outside the range, before the cursor position, or
+    without the requested action type are skipped without decompressing.
+    Logs without an action type are never returned.
+
+    Args:
+        day: Segment day, YYYY-MM-DD
+        start: Start of the range, inclusive
+        end: End of the range, inclusive
+        filters: Exact-match filters on itemId, userId and actionType
+        after: Optional (timestamp, _id) to start after, from a page cursor
+    """
+    path = segment_path(day)
+    if not os.path.exists(path):
+        return
+    start_key, end_key = _timestamp_key(start), _timestamp_key(end)
+    after_key = (_timestamp_key(after[0]), after[1]) if after else None
+    with LogSegment(path) as segment:
+        for block in segment.blocks:
+            if block["last"] < start_key or block["first"] > end_key:
+                continue
+            if after_key and block["last"] < after_key[0]:
+                continue
+            if "actionType" in filters and filters["actionType"] not in block["actionTypes"]:
+                continue
+            for log in segment.read_block(block):
+                if not log.get("actionType"):
+                    # Entity logs of the /items routes are archived with the rest but are not action logs
+                    continue
+                key = log_sort_key(log)
+                if key[0] < start_key or key[0] > end_key:
+                    continue
+                if after_key and key <= after_key:
+                    continue
+                if any(log.get(field) != value for field, value in filters.items()):
+                    continue
+                yield log
+
+def read_archived_page(
+    start: Any,
+    end: Any,
+    filters: Dict[str, str],
+    after: Optional[Tuple[Any, Any]],
+    limit: int
+) -> List[Dict[str, Any]]:
+    """Read up to limit archived logs matching a range query, oldest first"""
+    logs: List[Dict[str, Any]] = []
+    for day in segment_days(log_day(start), log_day(end)):
+        for log in read_archived_logs(day, start, end, filters, after):
+            logs.append(log)
+            if len(logs) >= limit:
+                return logs
+    return logs
+
+async def acquire_archiver_lease(owner: str) -> bool:
+    """
+    Take or renew the archiver lease
+
+    Returns:
+        Whether owner now holds the lease; False while another process holds an unexpired one
+    """
+    now = utc_now()
+    try:
+        await locks_collection.update_one(
+            {"_id": ARCHIVER_LEASE, "$or": [{"owner": owner}, {"expiresAt": {"$lt": now}}]},
+            {"$set": {"owner": owner, "expiresAt": now + timedelta(seconds=LOG_ARCHIVE_LEASE_SECONDS)}},
+            upsert=True
+        )
+    except DuplicateKeyError:
+        # The lease document exists and belongs to someone else
+        return False
+    return True
+
+async def release_archiver_lease(owner: str) -> None:
+    await locks_collection.delete_one({"_id": ARCHIVER_LEASE, "owner": owner})
+
+async def archive_old_logs(retention_days: int = LOG_RETENTION_DAYS, now: Optional[datetime] = None) -> int:
+    """
+    Move logs older than the retention period from MongoDB to segment files
+
+    Logs are read in timestamp order and handled one day at a time: the
+    day's segment is written first, then its logs are deleted from MongoDB,
+    so an interrupted run never loses a log. Logs with a late timestamp are
+    merged into their day's existing segment.
+
+    Every worker process and the archive-logs migration call this, so a run
+    first takes the archiver lease and does nothing if another process holds
+    it. The lease is renewed after every day.
+
+    Returns:
+        Number of logs archived
+    """
+    owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex}"
+    if not await acquire_archiver_lease(owner):
+        print("Another process is archiving logs, skipping this run")
+        return 0
+    try:
+        return await _archive_old_logs(owner, retention_days, now)
+    finally:
+        await release_archiver_lease(owner)
+
+async def _archive_old_logs(owner: str, retention_days: int, now: Optional[datetime]) -> int:
+    cutoff = (now or utc_now()).replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=retention_days)
+    # Timestamps are stored as BSON dates or as ISO strings, and a range on one type does not match the other
+    query = {"$or": [
+        {"timestamp": {"$lt": cutoff}},
+        {"timestamp": {"$lt": cutoff.strftime("%Y-%m-%d")}},
+    ]}
+
+    archived = 0
+    day = None
+    batch: List[Dict[str, Any]] = []
+
+    async def flush_day() -> None:
+        nonlocal archived
+        if not await acquire_archiver_lease(owner):
+            raise RuntimeError("Lost the log archiver lease")
+        await asyncio.to_thread(write_segment, day, batch)
+        ids = [log["_id"] for log in batch]
+        for i in range(0, len(ids), 10000):
+            await logs_collection.delete_many({"_id": {"$in": ids[i:i + 10000]}})
+        archived += len(batch)
+
+    async for log in logs_collection.find(query).sort([("timestamp", ASCENDING), ("_id", ASCENDING)]).batch_size(SEGMENT_BLOCK_SIZE):
+        log_date = log_day(log["timestamp"])
+        if log_date != day and batch:
+            await flush_day()
+            batch = []
+        day = log_date
+        batch.append(log)
+    if batch:
+        await flush_day()
+
+    if archived:
+        print(f"Archived {archived} logs older than {cutoff.strftime('%Y-%m-%d')} to {LOG_ARCHIVE_DIR}")
+    return archived
+
+async def run_log_archiver() -> None:
+    """Archive old logs now and then every LOG_ARCHIVE_INTERVAL_HOURS, until cancelled"""
+    while True:
+        try:
+            await archive_old_logs()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Error archiving logs: {str(e)}")
+        await asyncio.sleep(LOG_ARCHIVE_INTERVAL_HOURS * 3600)
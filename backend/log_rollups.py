@@ -0,0 +1,186 @@
+import asyncio
+import os
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from bson import ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import DuplicateKeyError
+from db import logs_collection, log_rollups_collection, locks_collection
+from models import LogSummaryBucket, LogSummaryResponse
+from log_archive import log_day, read_segment, segment_days, utc_now
+
+# A bucket counts the logs of one day, action type, user and item
+ROLLUP_KEY_FIELDS = ("day", "actionType", "userId", "itemId")
+ROLLUP_DIMENSIONS = ("actionType", "userId", "itemId")
+ROLLUP_PERIODS = ("day", "week", "month")
+
+# Held while rebuild_log_rollups runs; its cutoff tells the write hook which entries to count as pending
+ROLLUP_REBUILD_LEASE = "log-rollups-rebuild"
+LOG_ROLLUP_REBUILD_LEASE_SECONDS = int(os.getenv("LOG_ROLLUP_REBUILD_LEASE_SECONDS", "3600"))
+# Time given to entries created before the cutoff to be flushed before the recount reads them
+LOG_ROLLUP_REBUILD_SETTLE_SECONDS = float(os.getenv("LOG_ROLLUP_REBUILD_SETTLE_SECONDS", "5"))
+
+def rollup_key(entry: Dict[str, Any]) -> Tuple[str, str, str, str]:
+    return log_day(entry.get("timestamp")), entry.get("actionType"), entry.get("userId"), entry.get("itemId")
+
+async def apply_log_rollups(entries: List[Dict[str, Any]]) -> None:
+    """
+    Add a batch of written log entries to their daily buckets
+
+    Entries are counted per bucket first, so a batch costs one upsert per
+    bucket it touches rather than one per entry. While the buckets are being
+    rebuilt, entries from the rebuild's cutoff on are also added to the
+    bucket's pending count, which the rebuild keeps.
+    """
+    entries = [entry for entry in entries if entry.get("actionType")]
+    if not entries:
+        return
+    counts = Counter(rollup_key(entry) for entry in entries)
+    pending: Counter = Counter()
+    rebuild = await locks_collection.find_one({"_id": ROLLUP_REBUILD_LEASE}, {"cutoff": 1})
+    if rebuild and rebuild.get("cutoff") is not None:
+        pending.update(rollup_key(entry) for entry in entries if entry.get("_id", rebuild["cutoff"]) >= rebuild["cutoff"])
+    await log_rollups_collection.bulk_write([
+        UpdateOne(
+            dict(zip(ROLLUP_KEY_FIELDS, key)),
+            {"$inc": {"count": count, **({"pending": pending[key]} if pending[key] else {})}},
+            upsert=True
+        )
+        for key, count in counts.items()
+    ], ordered=False)
+
+async def rebuild_log_rollups() -> int:
+    """
+    Recount every bucket from the logs collection
+
+    Used to backfill the buckets, or to repair them after a failed update.
+    Archived logs are counted too.
+
+    The buckets stay in use, and keep being updated by the write hook, while
+    they are recounted. The rebuild picks a cutoff _id and recounts the
+    entries before it; the hook adds entries from the cutoff on to a pending
+    count as well. Each bucket is then set to its recount plus its pending
+    count in one atomic update, so entries written during the rebuild are
+    neither lost nor counted twice. Only one rebuild runs at a time.
+
+    Returns:
+        Number of buckets written, 0 if another rebuild is running
+    """
+    now = utc_now()
+    try:
+        # No cutoff yet, so the hook leaves pending alone while old pending counts are cleared
+        await locks_collection.update_one(
+            {"_id": ROLLUP_REBUILD_LEASE, "expiresAt": {"$lt": now}},
+            {"$set": {"cutoff": None, "expiresAt": now + timedelta(seconds=LOG_ROLLUP_REBUILD_LEASE_SECONDS)}},
+            upsert=True
+        )
+    except DuplicateKeyError:
+        print("Another process is rebuilding the log rollups, skipping this run")
+        return 0
+
+    try:
+        await log_rollups_collection.update_many({"pending": {"$exists": True}}, {"$unset": {"pending": ""}})
+
+        # ObjectIds hold whole seconds, so the cutoff is the next second: every entry
+        # added before the hook could see the cutoff has an _id before it
+        cutoff_time = utc_now().replace(microsecond=0) + timedelta(seconds=1)
+        cutoff = ObjectId.from_datetime(cutoff_time)
+        await locks_collection.update_one({"_id": ROLLUP_REBUILD_LEASE}, {"$set": {"cutoff": cutoff}})
+        await asyncio.sleep((cutoff_time - utc_now()).total_seconds() + LOG_ROLLUP_REBUILD_SETTLE_SECONDS)
+
+        counts: Counter = Counter()
+        async for entry in logs_collection.find(
+            {"actionType": {"$exists": True}, "_id": {"$lt": cutoff}},
+            {"_id": 0, "timestamp": 1, "actionType": 1, "userId": 1, "itemId": 1}
+        ).batch_size(10000):
+            counts[rollup_key(entry)] += 1
+        for day in segment_days():
+            for entry in await asyncio.to_thread(read_segment, day):
+                if entry.get("actionType"):
+                    counts[rollup_key(entry)] += 1
+
+        # Buckets with no recounted entries keep only their pending count
+        async for bucket in log_rollups_collection.find({}, {"_id": 0, **{field: 1 for field in ROLLUP_KEY_FIELDS}}):
+            counts.setdefault(tuple(bucket.get(field) for field in ROLLUP_KEY_FIELDS), 0)
+        if counts:
+            await log_rollups_collection.bulk_write([
+                UpdateOne(
+                    dict(zip(ROLLUP_KEY_FIELDS, key)),
+                    [
+                        {"$set": {"count": {"$add": [count, {"$ifNull": ["$pending", 0]}]}}},
+                        {"$project": {"pending": 0}},
+                    ],
+                    upsert=True
+                )
+                for key, count in counts.items()
+            ], ordered=False)
+        await log_rollups_collection.delete_many({"count": {"$lte": 0}})
+        return len(counts)
+    finally:
+        await locks_collection.delete_one({"_id": ROLLUP_REBUILD_LEASE})
+
+def period_start(day: str, period: str) -> str:
+    """First day of the week (Monday) or month containing a YYYY-MM-DD day"""
+    if period == "day":
+        return day
+    try:
+        date = datetime.strptime(day, "%Y-%m-%d")
+    except ValueError:
+        return day
+    if period == "week":
+        return (date - timedelta(days=date.weekday())).strftime("%Y-%m-%d")
+    return date.strftime("%Y-%m-01")
+
+async def summarize_logs(
+    startDate: str,
+    endDate: str,
+    period: str = "day",
+    groupBy: Sequence[str] = ("actionType",),
+    itemId: Optional[str] = None,
+    userId: Optional[str] = None,
+    actionType: Optional[str] = None
+) -> LogSummaryResponse:
+    """
+    Count logs per period from the daily buckets
+
+    Args:
+        startDate: First day included, YYYY-MM-DD or an ISO timestamp
+        endDate: Last day included, YYYY-MM-DD or an ISO timestamp
+        period: "day", "week" (starting Monday) or "month"
+        groupBy: Dimensions kept in the result, any of actionType, userId and itemId
+        itemId: Optional filter for specific item
+        userId: Optional filter for specific user
+        actionType: Optional filter for action type
+
+    Returns:
+        LogSummaryResponse with one bucket per period and combination of the grouped dimensions
+    """
+    try:
+        if period not in ROLLUP_PERIODS or any(field not in ROLLUP_DIMENSIONS for field in groupBy):
+            return LogSummaryResponse(success=False)
+
+        query: Dict[str, Any] = {"day": {"$gte": log_day(startDate), "$lte": log_day(endDate)}}
+        for field, value in (("itemId", itemId), ("userId", userId), ("actionType", actionType)):
+            if value:
+                query[field] = value
+
+        # Sum the buckets per day in the database, then fold days into weeks or months
+        group_id = {"day": "$day", **{field: f"${field}" for field in groupBy}}
+        totals: Counter = Counter()
+        async for row in await log_rollups_collection.aggregate([
+            {"$match": query},
+            {"$group": {"_id": group_id, "count": {"$sum": "$count"}}},
+        ]):
+            key = row["_id"]
+            totals[(period_start(key["day"], period),) + tuple(key.get(field) for field in groupBy)] += row["count"]
+
+        buckets = [
+            LogSummaryBucket(period=key[0], count=count, **dict(zip(groupBy, key[1:])))
+            for key, count in sorted(totals.items(), key=lambda item: tuple(str(part) for part in item[0]))
+        ]
+        return LogSummaryResponse(success=True, buckets=buckets)
+
+    except Exception as e:
+        print(f"Error summarizing logs: {str(e)}")
+        return LogSummaryResponse(success=False)
@@ -0,0 +1,155 @@
+import asyncio
+import os
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+from bson import ObjectId
+from pymongo.errors import BulkWriteError
+from log_archive import utc_now
+
+# Buffered log entries are written once this many are waiting...
+LOG_FLUSH_SIZE = int(os.getenv("LOG_FLUSH_SIZE", "500"))
+# ...or once the oldest has waited this long
+LOG_FLUSH_INTERVAL_MS = int(os.getenv("LOG_FLUSH_INTERVAL_MS", "200"))
+# Writers wait for a flush instead of growing the buffer past this, e.g. while MongoDB is down
+LOG_BUFFER_MAX = int(os.getenv("LOG_BUFFER_MAX", "100000"))
+
+DUPLICATE_KEY_ERROR = 11000
+
+class LogWriter:
+    """
+    Buffers log entries in process and writes them with insert_many
+
+    Entries get their _id when they are added, so a batch retried after a
+    partial failure does not insert the same entry twice. An entry the
+    server rejects (for example one that is too large) is moved to the
+    optional dead_letters collection, or printed and dropped without one,
+    so it cannot hold back the entries queued after it. An optional
+    on_write coroutine is called once with every batch after it is written,
+    to maintain data derived from the logs.
+    """
+
+    def __init__(
+        self,
+        collection,
+        flush_size: int = LOG_FLUSH_SIZE,
+        flush_interval_ms: int = LOG_FLUSH_INTERVAL_MS,
+        max_buffered: int = LOG_BUFFER_MAX,
+        on_write: Optional[Callable[[List[Dict]], Awaitable[None]]] = None,
+        dead_letters=None
+    ):
+        self.collection = collection
+        self.on_write = on_write
+        self.dead_letters = dead_letters
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval_ms / 1000
+        self.max_buffered = max_buffered
+        self._buffer: List[Dict] = []
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        """Start the background flusher on the running event loop, if it is not running yet"""
+        if self._task is None or self._task.done() or self._task.get_loop() is not asyncio.get_running_loop():
+            self._flush_lock = asyncio.Lock()
+            self._wake = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def add(self, entry: Dict, flush: bool = False) -> None:
+        """
+        Queue a log entry
+
+        Args:
+            entry: Document to insert
+            flush: Wait until the entry, and everything queued before it, is written
+        """
+        self.start()
+        entry.setdefault("_id", ObjectId())
+        if len(self._buffer) >= self.max_buffered:
+            await self.flush()
+        self._buffer.append(entry)
+        if flush:
+            await self.flush()
+        elif len(self._buffer) >= self.flush_size:
+            self._wake.set()
+
+    async def flush(self) -> None:
+        """
+        Write every buffered entry
+
+        Raises:
+            Exception: The write error, after putting the entries back in the buffer
+        """
+        if self._flush_lock is None:
+            self.start()
+        async with self._flush_lock:
+            while self._buffer:
+                batch = self._buffer[:self.flush_size]
+                rejected = {}
+                try:
+                    await self.collection.insert_many(batch, ordered=False)
+                except BulkWriteError as e:
+                    # A write concern error says nothing about which entries are safe, retry them all
+                    if e.details.get("writeConcernErrors"):
+                        raise
+                    # Entries already written by an earlier attempt are fine; any other
+                    # write error belongs to that one entry, and the rest of the batch is written
+                    rejected = {
+                        error["index"]: error
+                        for error in e.details.get("writeErrors", [])
+                        if error.get("code") != DUPLICATE_KEY_ERROR
+                    }
+                del self._buffer[:len(batch)]
+                if rejected:
+                    await self._dead_letter([(batch[index], error) for index, error in rejected.items()])
+                    batch = [entry for index, entry in enumerate(batch) if index not in rejected]
+                if self.on_write is not None and batch:
+                    try:
+                        await self.on_write(batch)
+                    except Exception as e:
+                        # The entries are written; derived data can be rebuilt from them
+                        print(f"Error in log write hook for {len(batch)} entries: {str(e)}")
+
+    async def _dead_letter(self, rejected: List[Tuple[Dict, Dict]]) -> None:
+        """Keep log entries the server rejected out of the buffer, in the dead letter collection if there is one"""
+        for entry, error in rejected:
+            print(f"Log entry {entry.get('_id')} rejected with code {error.get('code')}: {error.get('errmsg')}")
+        if self.dead_letters is None:
+            return
+        documents = [
+            {"_id": entry["_id"], "entry": entry, "code": error.get("code"), "errmsg": error.get("errmsg"), "failedAt": utc_now()}
+            for entry, error in rejected
+        ]
+        try:
+            await self.dead_letters.insert_many(documents, ordered=False)
+        except Exception as e:
+            # The entries may be rejected here too (too large, say); they are dropped after being printed
+            print(f"Could not store {len(documents)} rejected log entries: {str(e)}")
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                await self.flush()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Error flushing {len(self._buffer)} log entries, will retry: {str(e)}")
+
+    async def stop(self) -> None:
+        """Stop the background flusher and write whatever is still buffered"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._buffer:
+            await self.flush()
+
+    def pending(self) -> int:
+        return len(self._buffer)
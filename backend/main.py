@@ -3,6 +3,12 @@ from fastapi.middleware.cors import CORSMiddleware
 import uvicorn
 from routes import api_router
 from db import client as mongodb_client
+from executors import start_executors, shutdown_executors
+from db_indexes import ensure_indexes, index_report
+from import_jobs import resume_interrupted_jobs
+from log_algorithms import log_writer
+from log_archive import run_log_archiver
+import asyncio
 import logging
 import inspect
 
@@ -33,11 +39,68 @@ app.add_middleware(
 async def startup_db_client():
     try:
         # Test MongoDB connection
-        mongodb_client.admin.command('ping')
+        await mongodb_client.admin.command('ping')
         logger.info("MongoDB connection successful")
     except Exception as e:
         logger.error(f"MongoDB connection failed: {e}")
 
+# Create any missing indexes before the first request hits the hot query paths
+@app.on_event("startup")
+async def startup_indexes():
+    try:
+        failures = await ensure_indexes()
+        if failures:
+            logger.warning(f"Indexes that could not be created: {failures}")
+        else:
+            logger.info("All required indexes are in place")
+    except Exception as e:
+        logger.error(f"Index bootstrap failed: {e}")
+
+# Start the CPU worker pool up front so the first heavy request does not pay for it
+@app.on_event("startup")
+async def startup_executors():
+    start_executors()
+
+# Pick up background imports interrupted by the last shutdown from their checkpoints
+@app.on_event("startup")
+async def startup_import_jobs():
+    try:
+        resumed = await resume_interrupted_jobs()
+        if resumed:
+            logger.info(f"Resumed {resumed} interrupted import jobs")
+    except Exception as e:
+        logger.error(f"Could not resume import jobs: {e}")
+
+# Start the background writer that batches audit log entries
+@app.on_event("startup")
+async def startup_log_writer():
+    log_writer.start()
+
+# Move logs past the retention period to archive segments, on startup and then periodically
+@app.on_event("startup")
+async def startup_log_archiver():
+    app.state.log_archiver = asyncio.create_task(run_log_archiver())
+
+@app.on_event("shutdown")
+async def shutdown_log_archiver():
+    app.state.log_archiver.cancel()
+
+@app.on_event("shutdown")
+async def shutdown_executor_pool():
+    shutdown_executors()
+
+# Write any buffered log entries while the MongoDB client is still open
+@app.on_event("shutdown")
+async def shutdown_log_writer():
+    try:
+        await log_writer.stop()
+    except Exception as e:
+        logger.error(f"Could not write {log_writer.pending()} buffered log entries: {e}")
+
+@app.on_event("shutdown")
+async def shutdown_db_client():
+    await mongodb_client.close()
+
 # Debug endpoint to list all registered routes
 @app.get("/debug/routes", tags=["Debug"])
 async def list_routes():
@@ -51,6 +114,11 @@ async def list_routes():
     logger.info(f"Registered routes: {routes}")
     return routes
 
+# Debug endpoint to report missing and unused indexes
+@app.get("/debug/indexes", tags=["Debug"])
+async def list_indexes():
+    return await index_report()
+
 # Print detailed information about routes in api_router
 logger.info("API Router routes before mounting:")
 for route in api_router.routes:
@@ -0,0 +1,153 @@
+import argparse
+import asyncio
+from pymongo import UpdateOne
+from db import items_collection, placements_collection, logs_collection, close_client
+from item_fields import normalized_fields, parse_usage_limit
+from placement_store import next_arrangement_seq
+from log_rollups import rebuild_log_rollups
+from log_archive import archive_old_logs, parse_log_timestamp, read_segment, segment_days, utc_now, write_segment
+
+MIGRATION_BATCH_SIZE = 1000
+
+async def normalize_items(batch_size: int = MIGRATION_BATCH_SIZE) -> int:
+    """
+    Add the normalized fields to item documents stored before they existed
+
+    Only documents without a volume field are touched, so the migration can
+    be re-run or interrupted safely.
+
+    Returns:
+        Number of items updated
+    """
+    updated = 0
+    operations = []
+    cursor = items_collection.find(
+        {"volume": {"$exists": False}},
+        {"_id": 1, "width": 1, "depth": 1, "height": 1, "usageLimit": 1, "expiryDate": 1}
+    ).batch_size(batch_size)
+    async for item in cursor:
+        operations.append(UpdateOne({"_id": item["_id"]}, {"$set": normalized_fields(item)}))
+        if len(operations) >= batch_size:
+            await items_collection.bulk_write(operations, ordered=False)
+            updated += len(operations)
+            operations = []
+    if operations:
+        await items_collection.bulk_write(operations, ordered=False)
+        updated += len(operations)
+    return updated
+
+async def sequence_placements(batch_size: int = MIGRATION_BATCH_SIZE) -> int:
+    """
+    Give placements stored before change tracking a sequence number
+
+    Without one they would never appear in incremental exports.
+
+    Returns:
+        Number of placements updated
+    """
+    updated = 0
+    while True:
+        batch = await placements_collection.find(
+            {"seq": {"$exists": False}},
+            {"_id": 1}
+        ).limit(batch_size).to_list(None)
+        if not batch:
+            return updated
+        last_seq = await next_arrangement_seq(len(batch))
+        now = utc_now()
+        await placements_collection.bulk_write([
+            UpdateOne({"_id": placement["_id"]}, {"$set": {"seq": last_seq - len(batch) + 1 + i, "updatedAt": now}})
+            for i, placement in enumerate(batch)
+        ], ordered=False)
+        updated += len(batch)
+
+async def count_item_uses(batch_size: int = MIGRATION_BATCH_SIZE) -> int:
+    """
+    Give items stored before usage was counted a remainingUses counter
+
+    Their past uses were never recorded, so every item starts with its full
+    usage limit. Items that already have a counter are left alone.
+
+    Returns:
+        Number of items updated
+    """
+    updated = 0
+    operations = []
+    cursor = items_collection.find(
+        {"remainingUses": {"$exists": False}},
+        {"_id": 1, "usageLimit": 1}
+    ).batch_size(batch_size)
+    async for item in cursor:
+        operations.append(UpdateOne(
+            {"_id": item["_id"], "remainingUses": {"$exists": False}},
+            {"$set": {"remainingUses": parse_usage_limit(item.get("usageLimit", "N/A"))}}
+        ))
+        if len(operations) >= batch_size:
+            await items_collection.bulk_write(operations, ordered=False)
+            updated += len(operations)
+            operations = []
+    if operations:
+        await items_collection.bulk_write(operations, ordered=False)
+        updated += len(operations)
+    return updated
+
+def _convert_timestamp(log: dict) -> bool:
+    """Replace a string timestamp with a BSON date in place, returns whether it changed"""
+    if not isinstance(log.get("timestamp"), str):
+        return False
+    try:
+        log["timestamp"] = parse_log_timestamp(log["timestamp"])
+        return True
+    except ValueError:
+        print(f"Log {log['_id']} has an invalid timestamp {log['timestamp']!r}, left as is")
+        return False
+
+async def convert_log_timestamps(batch_size: int = MIGRATION_BATCH_SIZE) -> int:
+    """
+    Convert log timestamps stored as ISO strings to BSON dates, in MongoDB and in the archive
+
+    Returns:
+        Number of logs converted
+    """
+    converted = 0
+    operations = []
+    async for log in logs_collection.find({"timestamp": {"$type": "string"}}, {"_id": 1, "timestamp": 1}).batch_size(batch_size):
+        if _convert_timestamp(log):
+            operations.append(UpdateOne({"_id": log["_id"]}, {"$set": {"timestamp": log["timestamp"]}}))
+        if len(operations) >= batch_size:
+            await logs_collection.bulk_write(operations, ordered=False)
+            converted += len(operations)
+            operations = []
+    if operations:
+        await logs_collection.bulk_write(operations, ordered=False)
+        converted += len(operations)
+
+    for day in segment_days():
+        logs = await asyncio.to_thread(read_segment, day)
+        changed = [log for log in logs if _convert_timestamp(log)]
+        if changed:
+            # Converted logs replace their old copies when the segment is rewritten
+            await asyncio.to_thread(write_segment, day, changed)
+            converted += len(changed)
+    return converted
+
+MIGRATIONS = {
+    "normalize-items": normalize_items,
+    "sequence-placements": sequence_placements,
+    "rebuild-log-rollups": rebuild_log_rollups,
+    "archive-logs": archive_old_logs,
+    "convert-log-timestamps": convert_log_timestamps,
+    "count-item-uses": count_item_uses,
+}
+
+async def main(name: str) -> None:
+    try:
+        count = await MIGRATIONS[name]()
+        print(f"Migration {name} updated {count} documents")
+    finally:
+        await close_client()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a one-time data migration")
+    parser.add_argument("migration", choices=sorted(MIGRATIONS))
+    asyncio.run(main(parser.parse_args().migration))
@@ -33,11 +33,15 @@ class Container(BaseModel):
 class PlacementRequest(BaseModel):
     items: List[Item]
     containers: List[Container]
+    incremental: bool = False  # Plan around the arrangement already stored in the database
+    timeBudgetMs: Optional[int] = Field(None, gt=0)  # Return the best plan found within this time
+    portfolio: bool = False  # Race every packing strategy in parallel and keep the best plan
 
 class Placement(BaseModel):
     itemId: str
     containerId: str
     position: Position
+    rotation: int = 0  # Index into packing_algorithms.ROTATIONS
 
 class Rearrangement(BaseModel):
     step: int
@@ -52,6 +56,7 @@ class PlacementResponse(BaseModel):
     success: bool
     placements: List[Placement]
     rearrangements: List[Rearrangement]
+    complete: bool = True  # False when the time budget ran out before every item was planned
 
 class RetrievalStep(BaseModel):
     step: int
@@ -79,6 +84,7 @@ class PlaceItemRequest(BaseModel):
     timestamp: str
     containerId: str
     position: Position
+    rotation: int = 0
 
 class WasteItem(BaseModel):
     itemId: str
@@ -166,8 +172,34 @@ class ImportError(BaseModel):
 class ImportResponse(BaseModel):
     success: bool
     itemsImported: int
+    # Per distinct itemId/containerId, compared with the stored content hash
+    inserted: int = 0
+    updated: int = 0
+    unchanged: int = 0
     errors: List[ImportError] = []
 
+class ImportJobStatus(BaseModel):
+    jobId: str
+    kind: Literal["items", "containers"]
+    status: Literal["queued", "running", "completed", "failed"]
+    rowsParsed: int = 0
+    rowsImported: int = 0
+    rowsRejected: int = 0
+    inserted: int = 0
+    updated: int = 0
+    unchanged: int = 0
+    committedRows: int = 0  # Rows covered by the last checkpoint; a resumed job starts after these
+    rowsPerSecond: float = 0.0
+    createdAt: str
+    finishedAt: Optional[str] = None
+    message: Optional[str] = None
+    errors: List[ImportError] = []
+
+class ImportJobResponse(BaseModel):
+    success: bool
+    job: Optional[ImportJobStatus] = None
+    message: Optional[str] = None
+
 class LogDetails(BaseModel):
     fromContainer: Optional[str] = None
     toContainer: Optional[str] = None
@@ -186,8 +218,22 @@ class LogRequest(BaseModel):
     itemId: Optional[str] = None
     userId: Optional[str] = None
     actionType: Optional[str] = None
+    cursor: Optional[str] = None
+    limit: Optional[int] = Field(None, ge=1, le=10000)
 
 class LogResponse(BaseModel):
     success: bool
     logs: List[LogEntry] = []
+    nextCursor: Optional[str] = None  # Pass back as cursor to get the next page, None on the last page
+
+class LogSummaryBucket(BaseModel):
+    period: str  # First day of the day, week or month, YYYY-MM-DD
+    actionType: Optional[str] = None
+    userId: Optional[str] = None
+    itemId: Optional[str] = None
+    count: int
+
+class LogSummaryResponse(BaseModel):
+    success: bool
+    buckets: List[LogSummaryBucket] = []
 
@@ -0,0 +1,329 @@
+from typing import Dict, List, Optional, Sequence, Tuple
+from bisect import bisect_left
+import numpy as np
+from models import Container, Position
+from spatial_index import ContainerSpatialIndex, Vector, box_to_position
+
+# The six axis-aligned orientations of a box, as permutations of (width, depth, height).
+# The index in this list is the rotation code stored with a placement.
+ROTATIONS = np.array([
+    (0, 1, 2),
+    (1, 0, 2),
+    (0, 2, 1),
+    (2, 0, 1),
+    (1, 2, 0),
+    (2, 1, 0),
+])
+
+# Ranked candidates are checked for collisions this many at a time
+CANDIDATE_CHUNK = 256
+# Initial number of rows in a container's box arrays; they double when full
+INITIAL_BOX_CAPACITY = 64
+
+def _overlap_matrix(starts: np.ndarray, ends: np.ndarray, other_starts: np.ndarray, other_ends: np.ndarray) -> np.ndarray:
+    """
+    Pairwise overlap of (n, 3) boxes with (m, 3) boxes as an (n, m) boolean matrix
+
+    The three axes are compared one by one; reducing a trailing axis of
+    length 3 with np.all is several times slower than combining the slices.
+    """
+    overlaps = (starts[:, None, 0] < other_ends[None, :, 0]) & (other_starts[None, :, 0] < ends[:, None, 0])
+    for axis in (1, 2):
+        overlaps &= (starts[:, None, axis] < other_ends[None, :, axis]) & (other_starts[None, :, axis] < ends[:, None, axis])
+    return overlaps
+
+class ContainerSpace:
+    """
+    Tracks the occupied space of a single container while a placement batch is planned.
+
+    Free space is described with extreme points: the corners left behind by
+    every placed box. A new box is only ever anchored on one of these points,
+    which keeps the candidate set small while still packing boxes tightly
+    against each other and against the container walls.
+    """
+
+    def __init__(self, container: Container, min_side: float = 1e-6):
+        self.container = container
+        # Smallest side of any box that will still be placed; corners with less room than this are dropped
+        self.min_side = max(min_side, 1e-6)
+        self.container_id = container.containerId
+        self.size: Vector = (container.width, container.depth, container.height)
+        self.index = ContainerSpatialIndex(self.container_id, self.size)
+        self.extreme_points: List[Vector] = [(0, 0, 0)]
+        self.used_volume = 0
+        self._points_array: Optional[np.ndarray] = None
+        # Box corners for the vectorized overlap test; row i holds the box of box_ids[i]
+        self.box_starts = np.empty((INITIAL_BOX_CAPACITY, 3))
+        self.box_ends = np.empty((INITIAL_BOX_CAPACITY, 3))
+        self.box_ids: List[str] = []
+        self._box_rows: Dict[str, int] = {}
+
+    @property
+    def free_volume(self) -> float:
+        return self.size[0] * self.size[1] * self.size[2] - self.used_volume
+
+    def points_array(self) -> np.ndarray:
+        """Extreme points as an (n, 3) array, rebuilt only after a placement"""
+        if self._points_array is None:
+            self._points_array = np.array(self.extreme_points, dtype=np.float64).reshape(-1, 3)
+        return self._points_array
+
+    def free_mask(self, starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+        """
+        Vectorized check of which (n, 3) candidate boxes do not overlap any placed box
+
+        Every candidate is tested on its own against the placed boxes. Boxes
+        entirely outside the region spanned by the candidates are dropped
+        first with one array comparison, so the pairwise test only covers
+        the boxes that can overlap at least one candidate.
+        """
+        count = len(self.box_ids)
+        box_starts, box_ends = self.box_starts[:count], self.box_ends[:count]
+        near = _overlap_matrix(box_starts, box_ends, starts.min(axis=0)[None, :], ends.max(axis=0)[None, :])[:, 0]
+        if not near.any():
+            return np.ones(len(starts), dtype=bool)
+        return ~_overlap_matrix(starts, ends, box_starts[near], box_ends[near]).any(axis=1)
+
+    def place(self, item_id: str, start: Vector, dims: Vector) -> Position:
+        """
+        Mark a box as occupied and update the extreme points
+
+        Args:
+            item_id: ID of the item being placed
+            start: Start coordinates returned by find_best_position
+            dims: Box size as (width, depth, height), already rotated
+
+        Returns:
+            Position of the placed box
+        """
+        end = (start[0] + dims[0], start[1] + dims[1], start[2] + dims[2])
+        self._occupy(item_id, start, end)
+
+        # The box spawns one new corner along each axis
+        new_points = [
+            (end[0], start[1], start[2]),
+            (start[0], end[1], start[2]),
+            (start[0], start[1], end[2]),
+        ]
+
+        # A corner is dead once even the smallest box anchored on it would overlap something
+        reach = self.min_side
+        points = set()
+        for point in self.extreme_points:
+            if all(point[axis] < end[axis] and start[axis] < point[axis] + reach for axis in range(3)):
+                continue
+            points.add(point)
+        points.update(point for point in new_points if self._usable(point))
+        self.extreme_points = list(points)
+        self._points_array = None
+
+        return box_to_position(start, end)
+
+    def load(self, boxes: Sequence[Tuple[str, Vector, Vector]]) -> None:
+        """
+        Seed the container with boxes that are already stored in it
+
+        Args:
+            boxes: Tuples of (item id, start coordinates, end coordinates)
+        """
+        for item_id, start, end in boxes:
+            self._occupy(item_id, start, end)
+
+        # Every stored box contributes its three corners, as if it had been placed here
+        points = {(0, 0, 0)}
+        for _, start, end in boxes:
+            points.update([
+                (end[0], start[1], start[2]),
+                (start[0], end[1], start[2]),
+                (start[0], start[1], end[2]),
+            ])
+        self.extreme_points = [point for point in points if self._usable(point)]
+        self._points_array = None
+
+    def remove(self, item_id: str) -> Optional[Position]:
+        """
+        Free the space of a box, returning its old position
+
+        The start corner of the freed box becomes an extreme point again,
+        since a box of at least the same size is known to fit there.
+        """
+        box = self.index.remove(item_id)
+        if box is None:
+            return None
+        start, end = box
+
+        # Move the last box into the freed row
+        row, last = self._box_rows.pop(item_id), len(self.box_ids) - 1
+        if row != last:
+            moved_id = self.box_ids[last]
+            self.box_starts[row] = self.box_starts[last]
+            self.box_ends[row] = self.box_ends[last]
+            self.box_ids[row] = moved_id
+            self._box_rows[moved_id] = row
+        self.box_ids.pop()
+        self.used_volume -= (end[0] - start[0]) * (end[1] - start[1]) * (end[2] - start[2])
+
+        if start not in self.extreme_points:
+            self.extreme_points.append(start)
+        self._points_array = None
+        return box_to_position(start, end)
+
+    def _occupy(self, item_id: str, start: Vector, end: Vector) -> None:
+        self.index.insert(item_id, start, end)
+        row = len(self.box_ids)
+        if row == len(self.box_starts):
+            self.box_starts = np.concatenate([self.box_starts, np.empty_like(self.box_starts)])
+            self.box_ends = np.concatenate([self.box_ends, np.empty_like(self.box_ends)])
+        self.box_starts[row] = start
+        self.box_ends[row] = end
+        self.box_ids.append(item_id)
+        self._box_rows[item_id] = row
+        self.used_volume += (end[0] - start[0]) * (end[1] - start[1]) * (end[2] - start[2])
+
+    def _usable(self, point: Vector) -> bool:
+        reach = self.min_side
+        if any(point[axis] + reach > self.size[axis] for axis in range(3)):
+            return False
+        return not self.index.collides(point, (point[0] + reach, point[1] + reach, point[2] + reach))
+
+class ContainerIndex:
+    """
+    Zone to container lookup, with each zone's containers sorted by size.
+
+    A box fits a container in some orientation only if its sorted sides are
+    all no larger than the container's sorted sides. Containers are kept
+    ordered by their longest side, so the ones too small for an item are
+    skipped with a bisect instead of being tested one by one.
+    """
+
+    def __init__(self, spaces: Sequence[ContainerSpace]):
+        self._zones: Dict[str, Tuple[List[float], List[ContainerSpace]]] = {}
+        self._others: Dict[str, Tuple[List[float], List[ContainerSpace]]] = {}
+
+        by_zone: Dict[str, List[ContainerSpace]] = {}
+        for space in spaces:
+            by_zone.setdefault(space.container.zone, []).append(space)
+        for zone, zone_spaces in by_zone.items():
+            self._zones[zone] = self._sorted(zone_spaces)
+        self._all = self._sorted(spaces)
+
+    @staticmethod
+    def _sorted(spaces: Sequence[ContainerSpace]) -> Tuple[List[float], List[ContainerSpace]]:
+        ordered = sorted(spaces, key=lambda space: max(space.size))
+        return [max(space.size) for space in ordered], ordered
+
+    @staticmethod
+    def _eligible(entry: Tuple[List[float], List[ContainerSpace]], dims: Vector) -> List[ContainerSpace]:
+        keys, ordered = entry
+        sides = sorted(dims)
+        eligible = []
+        for space in ordered[bisect_left(keys, sides[2]):]:
+            container_sides = sorted(space.size)
+            if sides[0] <= container_sides[0] and sides[1] <= container_sides[1]:
+                eligible.append(space)
+        return eligible
+
+    def has_zone(self, zone: str) -> bool:
+        return zone in self._zones
+
+    def any_zone(self, dims: Vector) -> List[ContainerSpace]:
+        """Containers of all zones that are large enough for the box"""
+        return self._eligible(self._all, dims)
+
+    def in_zone(self, zone: str, dims: Vector) -> List[ContainerSpace]:
+        """Containers of a zone that are large enough for the box in some orientation"""
+        entry = self._zones.get(zone)
+        return self._eligible(entry, dims) if entry else []
+
+    def outside_zone(self, zone: str, dims: Vector) -> List[ContainerSpace]:
+        """Containers of every other zone that are large enough for the box"""
+        if zone not in self._zones:
+            return self._eligible(self._all, dims)
+        if zone not in self._others:
+            # Built once per zone and reused for every item that spills over
+            self._others[zone] = self._sorted([space for space in self._all[1] if space.container.zone != zone])
+        return self._eligible(self._others[zone], dims)
+
+def find_best_position(
+    spaces: Sequence[ContainerSpace],
+    dims: Vector
+) -> Optional[Tuple[ContainerSpace, Vector, Vector, int]]:
+    """
+    Score every rotation at every extreme point of every container in one array operation
+
+    Candidates are ranked front-most first, then lowest, then left-most, with
+    container order and a shallow orientation as tie breakers. Points where
+    the item cannot start in any orientation are dropped before ranking, and
+    the ranked survivors of the bounds check are then tested for collisions
+    in chunks, so the first free candidate is found without a per-candidate loop.
+
+    Args:
+        spaces: Containers to consider, in order of preference
+        dims: Item size as (width, depth, height)
+
+    Returns:
+        Tuple of (container space, start coordinates, rotated dimensions, rotation code),
+        or None if the item does not fit anywhere
+    """
+    volume = dims[0] * dims[1] * dims[2]
+    spaces = [space for space in spaces if space.free_volume >= volume]
+    if not spaces:
+        return None
+
+    # Every orientation of the box contains the cube of its smallest side at
+    # the anchor, so a point where that cube collides is dominated for this
+    # item and none of its rotations need to be ranked or tested
+    side = min(dims)
+    point_arrays = []
+    for space in spaces:
+        points = space.points_array()
+        if len(points):
+            points = points[space.free_mask(points, points + side)]
+        point_arrays.append(points)
+    starts = np.concatenate(point_arrays)
+    owners = np.repeat(np.arange(len(spaces)), [len(points) for points in point_arrays])
+    sizes = np.array([space.size for space in spaces], dtype=np.float64)[owners]
+
+    # (rotations, 3) sizes broadcast against (points, 3) anchors -> (points, rotations, 3) ends
+    rotated = np.asarray(dims, dtype=np.float64)[ROTATIONS]
+    ends = starts[:, None, :] + rotated[None, :, :]
+    fits = (ends[:, :, 0] <= sizes[:, None, 0]) & (ends[:, :, 1] <= sizes[:, None, 1]) & (ends[:, :, 2] <= sizes[:, None, 2])
+
+    point_ids, rotation_ids = np.nonzero(fits)
+    if len(point_ids) == 0:
+        return None
+
+    # np.lexsort uses the last key as the primary one
+    order = np.lexsort((
+        rotation_ids,
+        rotated[rotation_ids, 1],
+        owners[point_ids],
+        starts[point_ids, 0],
+        starts[point_ids, 2],
+        starts[point_ids, 1],
+    ))
+
+    point_ids, rotation_ids = point_ids[order], rotation_ids[order]
+    candidate_starts = starts[point_ids]
+    candidate_ends = ends[point_ids, rotation_ids]
+    candidate_owners = owners[point_ids]
+
+    for chunk in range(0, len(point_ids), CANDIDATE_CHUNK):
+        window = slice(chunk, chunk + CANDIDATE_CHUNK)
+        chunk_owners = candidate_owners[window]
+        free = np.zeros(len(chunk_owners), dtype=bool)
+        for owner in np.unique(chunk_owners):
+            mask = chunk_owners == owner
+            free[mask] = spaces[owner].free_mask(candidate_starts[window][mask], candidate_ends[window][mask])
+
+        hits = np.flatnonzero(free)
+        if len(hits):
+            best = chunk + hits[0]
+            rotation_id = int(rotation_ids[best])
+            return (
+                spaces[candidate_owners[best]],
+                tuple(candidate_starts[best].tolist()),
+                tuple(rotated[rotation_id].tolist()),
+                rotation_id
+            )
+    return None
@@ -0,0 +1,166 @@
+from typing import Dict, Iterable, List, Optional
+from pymongo import ASCENDING, DESCENDING, ReturnDocument, UpdateOne
+from db import (
+    containers_collection, items_collection, placements_collection,
+    placement_tombstones_collection, counters_collection
+)
+from log_archive import utc_now
+from models import Position
+from spatial_index import ContainerSpatialIndex, build_container_indexes, placement_document
+
+# Counter bumped by every change to the arrangement; incremental exports filter on it
+ARRANGEMENT_COUNTER = "arrangement"
+# Counter bumped after every write to the containers, so cached container data can be validated
+CONTAINERS_COUNTER = "containers"
+
+async def next_arrangement_seq(count: int = 1) -> int:
+    """
+    Reserve change sequence numbers for the arrangement
+
+    Returns:
+        The last of the count reserved numbers
+    """
+    counter = await counters_collection.find_one_and_update(
+        {"_id": ARRANGEMENT_COUNTER},
+        {"$inc": {"seq": count}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    return counter["seq"]
+
+async def current_arrangement_seq() -> int:
+    """
+    Sequence number of the latest change written to the arrangement, 0 before the first one
+
+    Read from the stored placements and tombstones rather than the counter,
+    since a number is reserved before its change is written; advertising the
+    counter could hand a client a number whose change it cannot see yet.
+    """
+    latest = 0
+    for collection in (placements_collection, placement_tombstones_collection):
+        document = await collection.find_one({}, {"_id": 0, "seq": 1}, sort=[("seq", DESCENDING)])
+        if document and document.get("seq"):
+            latest = max(latest, document["seq"])
+    return latest
+
+async def bump_container_version() -> None:
+    """Record that container documents changed; call after the write"""
+    await counters_collection.update_one({"_id": CONTAINERS_COUNTER}, {"$inc": {"seq": 1}}, upsert=True)
+
+async def current_container_version() -> int:
+    """Number of container writes so far, 0 before the first one"""
+    counter = await counters_collection.find_one({"_id": CONTAINERS_COUNTER})
+    return counter["seq"] if counter else 0
+
+async def load_container_indexes(container_ids: Optional[Iterable[str]] = None) -> Dict[str, ContainerSpatialIndex]:
+    """
+    Load the stored arrangement into one spatial index per container
+
+    Args:
+        container_ids: Optional list of containers to load, all containers if omitted
+
+    Returns:
+        Dictionary of container id to its spatial index
+    """
+    query = {}
+    if container_ids is not None:
+        query["containerId"] = {"$in": list(container_ids)}
+
+    containers = await containers_collection.find(query, {"_id": 0}).to_list(None)
+    placements = await placements_collection.find(query, {"_id": 0, "itemId": 1, "containerId": 1, "position": 1}).to_list(None)
+    return build_container_indexes(placements, containers)
+
+async def find_blockers(container_id: str, position: Position, ignore: Optional[str] = None) -> List[str]:
+    """
+    Find the stored items between a position and the open face of its container
+
+    Same result as ContainerSpatialIndex.in_front_of, but answered by a range
+    query on the stored positions instead of loading the whole container.
+
+    Args:
+        container_id: Container holding the position
+        position: Position to look in front of
+        ignore: Optional item id to leave out of the result (usually the item itself)
+
+    Returns:
+        Ids of the blocking items, front-most first
+    """
+    start, end = position.startCoordinates, position.endCoordinates
+    if start.depth <= 0:
+        return []
+    query = {
+        "containerId": container_id,
+        "position.startCoordinates.depth": {"$lt": start.depth},
+        "position.endCoordinates.depth": {"$gt": 0},
+        "position.startCoordinates.width": {"$lt": end.width},
+        "position.endCoordinates.width": {"$gt": start.width},
+        "position.startCoordinates.height": {"$lt": end.height},
+        "position.endCoordinates.height": {"$gt": start.height},
+    }
+    if ignore is not None:
+        query["itemId"] = {"$ne": ignore}
+    blockers = await placements_collection.find(
+        query, {"_id": 0, "itemId": 1}
+    ).sort([("position.startCoordinates.depth", ASCENDING), ("itemId", ASCENDING)]).to_list(None)
+    return [blocker["itemId"] for blocker in blockers]
+
+async def load_existing_placements(container_ids: Iterable[str]) -> List[Dict]:
+    """
+    Load the stored placements of some containers for incremental planning
+
+    Each placement is joined with the priority and preferred zone of its item,
+    which the planner needs to decide what may be moved out of the way.
+    """
+    placements = await placements_collection.find(
+        {"containerId": {"$in": list(container_ids)}},
+        {"_id": 0, "itemId": 1, "containerId": 1, "position": 1, "rotation": 1}
+    ).to_list(None)
+    items = {
+        item["itemId"]: item
+        async for item in items_collection.find(
+            {"itemId": {"$in": [placement["itemId"] for placement in placements]}},
+            {"_id": 0, "itemId": 1, "priority": 1, "preferredZone": 1}
+        )
+    }
+    for placement in placements:
+        item = items.get(placement["itemId"], {})
+        placement["priority"] = item.get("priority", 0)
+        placement["preferredZone"] = item.get("preferredZone", "")
+    return placements
+
+async def save_placement(item_id: str, container_id: str, position: Position, rotation: int = 0) -> None:
+    """Store the current location of an item, replacing any previous one"""
+    document = placement_document(item_id, container_id, position, rotation)
+    document["seq"] = await next_arrangement_seq()
+    document["updatedAt"] = utc_now()
+    await placements_collection.replace_one({"itemId": item_id}, document, upsert=True)
+    # The item is back in the arrangement, so an earlier removal no longer applies
+    await placement_tombstones_collection.delete_one({"itemId": item_id})
+
+async def remove_placements(item_ids: Iterable[str]) -> int:
+    """Remove the stored location of items that left the station, leaving a tombstone for each"""
+    removed = await placements_collection.find(
+        {"itemId": {"$in": list(item_ids)}},
+        {"_id": 0, "itemId": 1, "containerId": 1}
+    ).to_list(None)
+    if not removed:
+        return 0
+
+    last_seq = await next_arrangement_seq(len(removed))
+    removed_at = utc_now()
+    await placement_tombstones_collection.bulk_write([
+        UpdateOne(
+            {"itemId": placement["itemId"]},
+            {"$set": {
+                "itemId": placement["itemId"],
+                "containerId": placement["containerId"],
+                "seq": last_seq - len(removed) + 1 + i,
+                "removedAt": removed_at
+            }},
+            upsert=True
+        )
+        for i, placement in enumerate(removed)
+    ], ordered=False)
+
+    result = await placements_collection.delete_many({"itemId": {"$in": [placement["itemId"] for placement in removed]}})
+    return result.deleted_count
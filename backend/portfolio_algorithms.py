@@ -0,0 +1,135 @@
+import asyncio
+import time
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+from models import Item, Container, PlacementResponse
+from algorithms import PLACEMENT_STRATEGIES, calculate_placement
+from spatial_index import ContainerSpatialIndex, position_to_box
+from executors import run_cpu_bound
+
+def score_placement(
+    items: List[Item],
+    containers: List[Container],
+    response: PlacementResponse
+) -> Tuple[int, float, int]:
+    """
+    Score a placement plan, higher is better
+
+    Plans are compared on the number of items placed, then on the
+    priority-weighted volume placed, then on the fewest expected retrieval
+    steps (the number of items stored in front of each placed item).
+
+    Returns:
+        Tuple of (items placed, priority-weighted volume, negated retrieval steps)
+    """
+    priorities = {item.itemId: item.priority for item in items}
+    sizes = {container.containerId: (container.width, container.depth, container.height) for container in containers}
+
+    indexes: Dict[str, ContainerSpatialIndex] = {}
+    weighted_volume = 0.0
+    for placement in response.placements:
+        start, end = position_to_box(placement.position)
+        if placement.containerId not in indexes:
+            indexes[placement.containerId] = ContainerSpatialIndex(
+                placement.containerId,
+                sizes.get(placement.containerId, end)
+            )
+        indexes[placement.containerId].insert(placement.itemId, start, end)
+        volume = (end[0] - start[0]) * (end[1] - start[1]) * (end[2] - start[2])
+        weighted_volume += priorities.get(placement.itemId, 0) * volume
+
+    retrieval_steps = 0
+    for index in indexes.values():
+        for item_id, box in index.boxes.items():
+            retrieval_steps += len(index.in_front_of(*box, ignore=item_id))
+
+    return len(response.placements), weighted_volume, -retrieval_steps
+
+def run_strategy(
+    items: List[Item],
+    containers: List[Container],
+    existing: Optional[List[Dict]],
+    deadline: Optional[float],
+    strategy: str
+) -> Tuple[Tuple[int, float, int], PlacementResponse]:
+    """
+    Plan with one strategy and score the result, run inside a worker process
+
+    Args:
+        deadline: Optional wall-clock time (time.time()) by which the plan must be
+            done. It is absolute, so time spent waiting for a worker counts too.
+    """
+    time_budget_ms = None
+    if deadline is not None:
+        # At least 1 ms, since a budget of 0 would mean no limit at all
+        time_budget_ms = max(1, int((deadline - time.time()) * 1000))
+    response = calculate_placement(items, containers, existing, time_budget_ms, strategy)
+    return score_placement(items, containers, response), response
+
+def _discard_result(task: asyncio.Task) -> None:
+    # A strategy that missed the deadline still finishes on the pool; its result is dropped
+    if not task.cancelled():
+        task.exception()
+
+async def _wait_for_first_result(pending: Set[asyncio.Task]) -> Set[asyncio.Task]:
+    """Wait past the deadline until one strategy succeeds or all of them have failed, returning the rest"""
+    while pending:
+        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        if any(task.exception() is None for task in done):
+            break
+    return pending
+
+async def solve_placement_portfolio(
+    items: List[Item],
+    containers: List[Container],
+    existing: Optional[List[Dict]] = None,
+    time_budget_ms: Optional[int] = None,
+    strategies: Sequence[str] = PLACEMENT_STRATEGIES
+) -> PlacementResponse:
+    """
+    Race several placement strategies across the shared CPU pool and keep the best plan
+
+    With a time budget, every strategy works towards the same deadline and
+    the best plan finished by then is returned; strategies still queued or
+    running are not waited for. If none has finished, the first one to
+    finish is returned.
+
+    Args:
+        items: Items to place
+        containers: Containers available for the batch
+        existing: Optional stored placements to plan around
+        time_budget_ms: Optional time limit for the whole portfolio
+        strategies: Strategies to race
+
+    Returns:
+        The PlacementResponse with the best score
+
+    Raises:
+        ExecutorBusyError: If the CPU pool turned every strategy away
+    """
+    deadline = time.time() + time_budget_ms / 1000 if time_budget_ms else None
+    tasks = [
+        asyncio.ensure_future(run_cpu_bound(run_strategy, items, containers, existing, deadline, strategy))
+        for strategy in strategies
+    ]
+
+    if deadline is None:
+        await asyncio.wait(tasks)
+    else:
+        done, pending = await asyncio.wait(tasks, timeout=max(0.0, deadline - time.time()))
+        if not any(task.exception() is None for task in done):
+            pending = await _wait_for_first_result(pending)
+        for task in pending:
+            task.add_done_callback(_discard_result)
+
+    finished = [
+        (strategy, task.result())
+        for strategy, task in zip(strategies, tasks)
+        if task.done() and task.exception() is None
+    ]
+    if not finished:
+        # Every strategy failed, most likely because the pool was busy
+        raise next(task.exception() for task in tasks if task.done())
+
+    best_strategy, (best_score, best_response) = max(finished, key=lambda entry: entry[1][0])
+    print(f"Placement portfolio picked strategy {best_strategy} with score {best_score}")
+    return best_response
@@ -2,6 +2,7 @@ from fastapi import APIRouter, HTTPException, status, Body, Query
 from typing import List, Optional, Dict, Any
 from pydantic import BaseModel, Field
 from datetime import datetime
+from log_archive import utc_now
 from bson import ObjectId
 from db import items_collection, containers_collection, logs_collection, placements_collection
 
@@ -143,7 +144,7 @@ async def create_item(item: ItemCreate = Body(...)):
         "entity_type": "item",
         "entity_id": str(result.inserted_id),
         "details": item_dict,
-        "timestamp": datetime.now()
+        "timestamp": utc_now()  # Naive UTC, like the timestamps log_action stores
     }
     logs_collection.insert_one(log_entry)
     
@@ -176,7 +177,7 @@ async def update_item(item_id: str, item: ItemCreate = Body(...)):
         "entity_type": "item",
         "entity_id": item_id,
         "details": item_dict,
-        "timestamp": datetime.now()
+        "timestamp": utc_now()  # Naive UTC, like the timestamps log_action stores
     }
     logs_collection.insert_one(log_entry)
     
@@ -204,7 +205,7 @@ async def delete_item(item_id: str):
         "action": "delete",
         "entity_type": "item",
         "entity_id": item_id,
-        "timestamp": datetime.now()
+        "timestamp": utc_now()  # Naive UTC, like the timestamps log_action stores
     }
     logs_collection.insert_one(log_entry)
     
@@ -247,7 +248,7 @@ async def create_container(container: ContainerCreate = Body(...)):
         "entity_type": "container",
         "entity_id": str(result.inserted_id),
         "details": container_dict,
-        "timestamp": datetime.now()
+        "timestamp": utc_now()  # Naive UTC, like the timestamps log_action stores
     }
     logs_collection.insert_one(log_entry)
     
@@ -280,7 +281,7 @@ async def update_container(container_id: str, container: ContainerCreate = Body(
         "entity_type": "container",
         "entity_id": container_id,
         "details": container_dict,
-        "timestamp": datetime.now()
+        "timestamp": utc_now()  # Naive UTC, like the timestamps log_action stores
     }
     logs_collection.insert_one(log_entry)
     
@@ -308,7 +309,7 @@ async def delete_container(container_id: str):
         "action": "delete",
         "entity_type": "container",
         "entity_id": container_id,
-        "timestamp": datetime.now()
+        "timestamp": utc_now()  # Naive UTC, like the timestamps log_action stores
     }
     logs_collection.insert_one(log_entry)
     
@@ -367,7 +368,7 @@ async def create_placement(placement: PlacementCreate = Body(...)):
         "entity_type": "placement",
         "entity_id": str(result.inserted_id),
         "details": placement_dict,
-        "timestamp": datetime.now()
+        "timestamp": utc_now()  # Naive UTC, like the timestamps log_action stores
     }
     logs_collection.insert_one(log_entry)
     
@@ -7,5 +7,5 @@ router = APIRouter()
 @router.get("/api/containers")
 async def get_containers():
     """Get all containers from the database"""
-    containers = list(containers_collection.find({}, {"_id": 0}))
+    containers = await containers_collection.find({}, {"_id": 0}).to_list(None)
     return {"containers": containers}
\ No newline at end of file
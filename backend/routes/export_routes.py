@@ -1,57 +1,226 @@
-from fastapi import APIRouter, Response
-from db import placements_collection, items_collection, containers_collection
+from fastapi import APIRouter, Request, Response, Query
+from fastapi.responses import StreamingResponse
+from db import placements_collection, placement_tombstones_collection, items_collection, containers_collection
+from placement_store import current_arrangement_seq, current_container_version
+from arrangement_codec import encode_arrangement
+from log_archive import parse_log_timestamp
 import csv
+import gzip
 import io
-from typing import List, Dict, Any
+import os
+import zlib
+from typing import List, Dict, Any, AsyncIterator, Optional, Tuple
 
 router = APIRouter()
 
+# Placements fetched per cursor batch and written per CSV chunk
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "5000"))
+
+ARRANGEMENT_COLUMNS = ['containerId', 'itemId', 'x', 'y', 'z', 'rotation']
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """Whether the request's If-None-Match already names this ETag"""
+    if_none_match = request.headers.get("if-none-match", "")
+    return etag in [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")] or if_none_match.strip() == "*"
+
+def parse_since(since: str) -> Tuple[Dict, Dict]:
+    """
+    Turn the since parameter of an incremental export into placement and tombstone filters
+
+    Args:
+        since: A change sequence number from X-Arrangement-Seq, or an ISO timestamp,
+            taken as UTC when it has no offset
+
+    Returns:
+        Tuple of (placement query, tombstone query)
+
+    Raises:
+        ValueError: If since is neither
+    """
+    if since.isdigit():
+        query = {"seq": {"$gt": int(since)}}
+        return query, query
+    changed_after = parse_log_timestamp(since)
+    return {"updatedAt": {"$gt": changed_after}}, {"removedAt": {"$gt": changed_after}}
+
+async def arrangement_csv_chunks(
+    query: Optional[Dict] = None,
+    tombstone_query: Optional[Dict] = None,
+    batch_size: int = EXPORT_BATCH_SIZE
+) -> AsyncIterator[bytes]:
+    """
+    Yield the arrangement CSV one cursor batch at a time
+
+    Only one batch of placements and its encoded chunk are held in memory.
+
+    Args:
+        query: Optional filter on placements, all placements if omitted
+        tombstone_query: For incremental exports, the filter on removed items.
+            Adds a deleted column, with a row marked 1 for every removal.
+        batch_size: Rows per cursor batch and per chunk
+    """
+    output = io.StringIO()
+    writer = csv.writer(output)
+    incremental = tombstone_query is not None
+
+    # Write header row
+    writer.writerow(ARRANGEMENT_COLUMNS + (['deleted'] if incremental else []))
+
+    sources = [(
+        placements_collection,
+        query or {},
+        {"_id": 0, "containerId": 1, "itemId": 1, "x": 1, "y": 1, "z": 1, "rotation": 1},
+        [0]
+    )]
+    if incremental:
+        sources.append((placement_tombstones_collection, tombstone_query, {"_id": 0, "containerId": 1, "itemId": 1}, [1]))
+
+    rows = 0
+    for collection, source_query, projection, deleted in sources:
+        cursor = collection.find(source_query, projection).batch_size(batch_size)
+        try:
+            # Write data rows
+            async for placement in cursor:
+                writer.writerow([
+                    placement.get('containerId', ''),
+                    placement.get('itemId', ''),
+                    placement.get('x', 0),
+                    placement.get('y', 0),
+                    placement.get('z', 0),
+                    placement.get('rotation', 0)
+                ] + (deleted if incremental else []))
+                rows += 1
+                if rows % batch_size == 0:
+                    yield output.getvalue().encode("utf-8")
+                    output.seek(0)
+                    output.truncate(0)
+        except Exception as e:
+            # Headers are already sent, so the error can only end the stream early
+            print(f"Error exporting arrangement after {rows} rows: {str(e)}")
+            raise
+        finally:
+            await cursor.close()
+
+    if output.tell():
+        yield output.getvalue().encode("utf-8")
+
+async def gzip_chunks(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """Compress a byte stream into a single gzip member, chunk by chunk"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31 writes the gzip header and trailer
+    async for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
 @router.get("/api/export/arrangement", response_class=Response)
-async def export_arrangement():
+async def export_arrangement(
+    request: Request,
+    since: Optional[str] = Query(None, description="Change sequence number or ISO timestamp; only rows changed after it are exported")
+):
     """
     Export the current arrangement of items in containers as a CSV file
-    
+
+    The file is streamed from a batched cursor, gzip-compressed when the
+    client accepts it, so memory use does not grow with the arrangement.
+    With since, only placements changed after it are exported, plus a row
+    with deleted=1 for every item removed since. The ETag is derived from the
+    arrangement's change sequence, so If-None-Match on an unchanged
+    arrangement returns 304 without reading any placement.
+
     Returns:
         CSV file with the current arrangement data
     """
     try:
-        # Create a StringIO object to write CSV data
-        output = io.StringIO()
-        writer = csv.writer(output)
-        
-        # Write header row
-        writer.writerow(['containerId', 'itemId', 'x', 'y', 'z', 'rotation'])
-        
-        # Get all placements from the database
-        placements = list(placements_collection.find({}, {"_id": 0}))
-        
-        # Write data rows
-        for placement in placements:
-            writer.writerow([
-                placement.get('containerId', ''),
-                placement.get('itemId', ''),
-                placement.get('x', 0),
-                placement.get('y', 0),
-                placement.get('z', 0),
-                placement.get('rotation', 0)
-            ])
-        
-        # Get the CSV data as a string
-        csv_data = output.getvalue()
-        
+        queries = None
+        if since is not None:
+            try:
+                queries = parse_since(since)
+            except ValueError:
+                return Response(
+                    content="since must be a change sequence number or an ISO timestamp",
+                    media_type="text/plain",
+                    status_code=400
+                )
+
+        seq = await current_arrangement_seq()
+        gzipped = "gzip" in request.headers.get("accept-encoding", "").lower()
+        etag = f'"arrangement-{seq}"' if since is None else f'"arrangement-{seq}-since-{since}"'
+        if gzipped:
+            # The compressed body is a different representation, so it gets its own ETag
+            etag = etag[:-1] + '-gz"'
+        if etag_matches(request, etag):
+            return Response(status_code=304, headers={'ETag': etag, 'X-Arrangement-Seq': str(seq)})
+
         # Set response headers for CSV download
         headers = {
             'Content-Disposition': 'attachment; filename="arrangement_export.csv"',
-            'Content-Type': 'text/csv'
+            'Vary': 'Accept-Encoding',
+            'ETag': etag,
+            # Pass this back as since= to get the changes after this export
+            'X-Arrangement-Seq': str(seq)
         }
-        
+
+        chunks = arrangement_csv_chunks(*queries) if queries else arrangement_csv_chunks()
+        if gzipped:
+            headers['Content-Encoding'] = 'gzip'
+            chunks = gzip_chunks(chunks)
+
         # Return CSV response
-        return Response(content=csv_data, headers=headers)
-        
+        return StreamingResponse(chunks, media_type="text/csv", headers=headers)
+
     except Exception as e:
         # In case of error, return JSON response with error message
         return Response(
             content=f"Error exporting arrangement: {str(e)}",
             media_type="text/plain",
             status_code=500
-        )
\ No newline at end of file
+        )
+
+@router.get("/api/export/arrangement/binary", response_class=Response)
+async def export_arrangement_binary(
+    request: Request,
+    containerId: Optional[str] = Query(None, description="Only export this container and its items")
+):
+    """
+    Export container and item boxes as a packed little-endian buffer for the 3D viewer
+
+    See arrangement_codec for the layout. The buffer is gzip-compressed when
+    the client accepts it. Its ETag combines the arrangement's change
+    sequence with the container version, since the buffer holds both.
+
+    Returns:
+        application/octet-stream buffer with the arrangement
+    """
+    try:
+        seq = await current_arrangement_seq()
+        gzipped = "gzip" in request.headers.get("accept-encoding", "").lower()
+        etag = f'"arrangement-bin-{seq}-c{await current_container_version()}'
+        if containerId is not None:
+            etag += f'-{containerId}'
+        etag += '-gz"' if gzipped else '"'
+        if etag_matches(request, etag):
+            return Response(status_code=304, headers={'ETag': etag, 'X-Arrangement-Seq': str(seq)})
+
+        query = {} if containerId is None else {"containerId": containerId}
+        containers = await containers_collection.find(
+            query, {"_id": 0, "containerId": 1, "zone": 1, "width": 1, "depth": 1, "height": 1}
+        ).to_list(None)
+        placements = await placements_collection.find(
+            query, {"_id": 0, "itemId": 1, "containerId": 1, "position": 1, "rotation": 1, "x": 1, "y": 1, "z": 1}
+        ).batch_size(EXPORT_BATCH_SIZE).to_list(None)
+
+        content = encode_arrangement(containers, placements)
+        headers = {'Vary': 'Accept-Encoding', 'ETag': etag, 'X-Arrangement-Seq': str(seq)}
+        if gzipped:
+            headers['Content-Encoding'] = 'gzip'
+            content = gzip.compress(content, compresslevel=6)
+
+        return Response(content=content, media_type="application/octet-stream", headers=headers)
+
+    except Exception as e:
+        return Response(
+            content=f"Error exporting arrangement: {str(e)}",
+            media_type="text/plain",
+            status_code=500
+        )
@@ -1,13 +1,13 @@
-from fastapi import APIRouter, File, UploadFile
-from db import items_collection, containers_collection
-from models import ImportResponse, ImportError
-from import_algorithms import import_items_algorithm, import_containers_algorithm
+from fastapi import APIRouter, File, UploadFile, Query
+from typing import Optional
+from models import ImportResponse, ImportError, ImportJobResponse
+from import_pipeline import stream_import, IMPORT_BATCH_SIZE
+from import_jobs import create_import_job, get_import_job, resume_import_job
 
 router = APIRouter()
 
-@router.post("/api/import/items", response_model=ImportResponse)
-async def import_items(file: UploadFile = File(...)):
-    """Import items from a CSV file"""
+async def import_csv(kind: str, file: UploadFile, batch_size: Optional[int]) -> ImportResponse:
+    """Stream a CSV upload into the items or containers collection"""
     try:
         # Check if the file is a CSV
         if not file.filename.endswith('.csv'):
@@ -17,29 +17,8 @@ async def import_items(file: UploadFile = File(...)):
                 errors=[ImportError(row=0, message="Uploaded file must be a CSV file")]
             )
         
-        # Read the file content and decode it
-        content = await file.read()
-        content_str = content.decode('utf-8')
-        
-        # Use the import algorithm to parse the CSV
-        import_response, parsed_items = import_items_algorithm(content_str)
-        
-        # If import was successful, update or insert items in the database
-        if import_response.success and parsed_items:
-            for item in parsed_items:
-                # Check if item with this ID already exists
-                existing_item = items_collection.find_one({"itemId": item["itemId"]})
-                if existing_item:
-                    # Update existing item
-                    items_collection.update_one(
-                        {"itemId": item["itemId"]},
-                        {"$set": item}
-                    )
-                else:
-                    # Insert new item
-                    items_collection.insert_one(item)
-                    
-        return import_response
+        # Parse, validate and upsert the file in batches as it is read
+        return await stream_import(kind, file.read, batch_size or IMPORT_BATCH_SIZE)
         
     except Exception as e:
         return ImportResponse(
@@ -48,45 +27,62 @@ async def import_items(file: UploadFile = File(...)):
             errors=[ImportError(row=0, message=f"Error processing file: {str(e)}")]
         )
 
+@router.post("/api/import/items", response_model=ImportResponse)
+async def import_items(
+    file: UploadFile = File(...),
+    batchSize: Optional[int] = Query(None, ge=1, le=100000)
+):
+    """Import items from a CSV file"""
+    return await import_csv("items", file, batchSize)
+
 @router.post("/api/import/containers", response_model=ImportResponse)
-async def import_containers(file: UploadFile = File(...)):
+async def import_containers(
+    file: UploadFile = File(...),
+    batchSize: Optional[int] = Query(None, ge=1, le=100000)
+):
     """Import containers from a CSV file"""
+    return await import_csv("containers", file, batchSize)
+
+async def start_job(kind: str, file: UploadFile, batch_size: Optional[int]) -> ImportJobResponse:
+    """Spool a CSV upload and import it in the background"""
     try:
-        # Check if the file is a CSV
         if not file.filename.endswith('.csv'):
-            return ImportResponse(
-                success=False,
-                itemsImported=0,
-                errors=[ImportError(row=0, message="Uploaded file must be a CSV file")]
-            )
-        
-        # Read the file content and decode it
-        content = await file.read()
-        content_str = content.decode('utf-8')
-        
-        # Use the import algorithm to parse the CSV
-        import_response, parsed_containers = import_containers_algorithm(content_str)
-        
-        # If import was successful, update or insert containers in the database
-        if import_response.success and parsed_containers:
-            for container in parsed_containers:
-                # Check if container with this ID already exists
-                existing_container = containers_collection.find_one({"containerId": container["containerId"]})
-                if existing_container:
-                    # Update existing container
-                    containers_collection.update_one(
-                        {"containerId": container["containerId"]},
-                        {"$set": container}
-                    )
-                else:
-                    # Insert new container
-                    containers_collection.insert_one(container)
-                    
-        return import_response
-        
+            return ImportJobResponse(success=False, message="Uploaded file must be a CSV file")
+
+        job = await create_import_job(kind, file, batch_size)
+        return ImportJobResponse(success=True, job=job)
+
     except Exception as e:
-        return ImportResponse(
-            success=False,
-            itemsImported=0,
-            errors=[ImportError(row=0, message=f"Error processing file: {str(e)}")]
-        )
\ No newline at end of file
+        return ImportJobResponse(success=False, message=f"Error starting import: {str(e)}")
+
+@router.post("/api/import/jobs/items", response_model=ImportJobResponse)
+async def import_items_job(
+    file: UploadFile = File(...),
+    batchSize: Optional[int] = Query(None, ge=1, le=100000)
+):
+    """Import items from a CSV file in the background"""
+    return await start_job("items", file, batchSize)
+
+@router.post("/api/import/jobs/containers", response_model=ImportJobResponse)
+async def import_containers_job(
+    file: UploadFile = File(...),
+    batchSize: Optional[int] = Query(None, ge=1, le=100000)
+):
+    """Import containers from a CSV file in the background"""
+    return await start_job("containers", file, batchSize)
+
+@router.get("/api/import/jobs/{jobId}", response_model=ImportJobResponse)
+async def import_job_status(jobId: str):
+    """Report the progress of a background import"""
+    job = await get_import_job(jobId)
+    if not job:
+        return ImportJobResponse(success=False, message="Import job not found")
+    return ImportJobResponse(success=True, job=job)
+
+@router.post("/api/import/jobs/{jobId}/resume", response_model=ImportJobResponse)
+async def resume_import(jobId: str):
+    """Resume a failed background import from its last checkpoint"""
+    job = await resume_import_job(jobId)
+    if not job:
+        return ImportJobResponse(success=False, message="Import job not found")
+    return ImportJobResponse(success=True, job=job)
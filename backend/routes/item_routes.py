@@ -2,6 +2,7 @@ from fastapi import APIRouter, HTTPException, status, Body, Query
 from typing import List, Optional, Dict, Any
 from pydantic import BaseModel, Field, validator
 from datetime import datetime
+from log_archive import utc_now
 from bson import ObjectId
 from db import items_collection, logs_collection
 import json
@@ -146,7 +147,7 @@ async def get_all_items(
     
     Returns a list of items
     """
-    items = list(items_collection.find().skip(skip).limit(limit))
+    items = await items_collection.find().skip(skip).limit(limit).to_list(None)
     return mongo_to_pydantic(items, ItemResponse)
 
 
@@ -162,7 +163,7 @@ async def get_item(item_id: str):
     if not ObjectId.is_valid(item_id):
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid item ID format")
     
-    item = items_collection.find_one({"_id": ObjectId(item_id)})
+    item = await items_collection.find_one({"_id": ObjectId(item_id)})
     if not item:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Item not found")
     
@@ -197,7 +198,7 @@ async def create_item(item: ItemCreate = Body(..., example={
     """
     try:
         item_dict = item.dict()
-        result = items_collection.insert_one(item_dict)
+        result = await items_collection.insert_one(item_dict)
         
         # Log the creation
         log_entry = {
@@ -205,12 +206,12 @@ async def create_item(item: ItemCreate = Body(..., example={
             "entity_type": "item",
             "entity_id": str(result.inserted_id),
             "details": item_dict,
-            "timestamp": datetime.now()
+            "timestamp": utc_now()  # Naive UTC, like the timestamps log_action stores
         }
-        logs_collection.insert_one(log_entry)
+        await logs_collection.insert_one(log_entry)
         
         # Return the created item
-        new_item = items_collection.find_one({"_id": result.inserted_id})
+        new_item = await items_collection.find_one({"_id": result.inserted_id})
         return mongo_to_pydantic(new_item, ItemResponse)
     except ValueError as e:
         raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e))
@@ -251,6 +252,6 @@ async def update_item(
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid item ID format")
         
         # Check if item exists
-        existing_item = items_collection.find_one({"_id": ObjectId(item_id)})
+        existing_item = await items_collection.find_one({"_id": ObjectId(item_id)})
         if not existing_item:
             raise HTTPException(status_code=status.HTTP
@@ -1,7 +1,9 @@
-from fastapi import APIRouter
-from typing import Optional
-from models import LogResponse, LogRequest
-from log_algorithms import get_logs_algorithm
+from fastapi import APIRouter, Query, Response
+from fastapi.responses import StreamingResponse
+from typing import List, Literal, Optional
+from models import LogResponse, LogRequest, LogSummaryResponse
+from log_algorithms import get_logs_algorithm, build_log_query, stream_logs_ndjson, MAX_LOG_PAGE_SIZE, log_writer
+from log_rollups import summarize_logs
 
 router = APIRouter()
 
@@ -11,14 +13,56 @@ async def get_logs(
     endDate: str,
     itemId: Optional[str] = None,
     userId: Optional[str] = None,
-    actionType: Optional[str] = None
+    actionType: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_LOG_PAGE_SIZE)
 ):
     """
-    Get logs filtered by date range and optional parameters.
+    Get logs filtered by date range and optional parameters, one page at a time.
     
+    Pass the nextCursor of a response as cursor to get the following page.
     This endpoint uses the get_logs_algorithm from log_algorithms.py
     """
-    return get_logs_algorithm(startDate, endDate, itemId, userId, actionType)
+    return await get_logs_algorithm(startDate, endDate, itemId, userId, actionType, cursor, limit)
+
+@router.get("/api/logs/stream")
+async def stream_logs(
+    startDate: str,
+    endDate: str,
+    itemId: Optional[str] = None,
+    userId: Optional[str] = None,
+    actionType: Optional[str] = None
+):
+    """
+    Stream every matching log as newline-delimited JSON, for bulk consumers.
+    """
+    query = build_log_query(startDate, endDate, itemId, userId, actionType)
+    if query is None:
+        return Response(
+            content="Invalid date range or action type",
+            media_type="text/plain",
+            status_code=400
+        )
+    return StreamingResponse(stream_logs_ndjson(query), media_type="application/x-ndjson")
+
+@router.get("/api/logs/summary", response_model=LogSummaryResponse)
+async def get_log_summary(
+    startDate: str,
+    endDate: str,
+    period: Literal["day", "week", "month"] = "day",
+    groupBy: List[Literal["actionType", "userId", "itemId"]] = Query(["actionType"]),
+    itemId: Optional[str] = None,
+    userId: Optional[str] = None,
+    actionType: Optional[str] = None
+):
+    """
+    Count logs per day, week or month, grouped by action type, user and/or item.
+    
+    Served from the daily rollup buckets instead of scanning the logs.
+    """
+    # Count entries still waiting in the log buffer too
+    await log_writer.flush()
+    return await summarize_logs(startDate, endDate, period, groupBy, itemId, userId, actionType)
 
 @router.post("/api/logs", response_model=LogResponse)
 async def post_logs(request: LogRequest):
@@ -27,10 +71,12 @@ async def post_logs(request: LogRequest):
     
     This endpoint allows sending filtering criteria in the request body.
     """
-    return get_logs_algorithm(
+    return await get_logs_algorithm(
         request.startDate, 
         request.endDate, 
         request.itemId, 
         request.userId, 
-        request.actionType
+        request.actionType,
+        request.cursor,
+        request.limit
     )
\ No newline at end of file
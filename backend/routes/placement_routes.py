@@ -1,9 +1,14 @@
 from fastapi import APIRouter, HTTPException
 from typing import Optional
-from db import items_collection, containers_collection
+from db import items_collection, containers_collection, placements_collection
 from models import PlacementRequest, PlacementResponse, SearchResponse, PlaceItemRequest
 from algorithms import calculate_placement, search_item_algorithm
 from log_algorithms import log_action
+from portfolio_algorithms import solve_placement_portfolio
+from executors import run_cpu_bound, ExecutorBusyError
+from placement_store import find_blockers, load_existing_placements, save_placement
+from usage_store import use_item
+from spatial_index import position_from_document
 
 router = APIRouter()
 
@@ -11,8 +16,15 @@ router = APIRouter()
 async def create_placement(request: PlacementRequest):
     """Calculate optimal placement for items in containers"""
     try:
-        result = calculate_placement(request.items, request.containers)
+        existing = None
+        if request.incremental:
+            existing = await load_existing_placements(container.containerId for container in request.containers)
+        if request.portfolio:
+            return await solve_placement_portfolio(request.items, request.containers, existing, request.timeBudgetMs)
+        result = await run_cpu_bound(calculate_placement, request.items, request.containers, existing, request.timeBudgetMs)
         return result
+    except ExecutorBusyError as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error processing placement: {str(e)}")
 
@@ -32,19 +44,33 @@ async def search_item(
     elif itemName:
         query["name"] = itemName
     
-    item_data = items_collection.find_one(query, {"_id": 0})
+    item_data = await items_collection.find_one(query, {"_id": 0})
     
     if not item_data:
         return SearchResponse(success=True, found=False)
     
+    # Use the stored arrangement when the item has a recorded placement
+    placement = await placements_collection.find_one({"itemId": item_data["itemId"]}, {"_id": 0})
+    position = position_from_document(placement) if placement else None
+    if position:
+        container = await containers_collection.find_one({"containerId": placement["containerId"]}, {"_id": 0})
+        if container:
+            blocker_ids = await find_blockers(placement["containerId"], position, ignore=item_data["itemId"])
+            blocker_docs = {
+                blocker["itemId"]: blocker
+                async for blocker in items_collection.find({"itemId": {"$in": blocker_ids}}, {"_id": 0, "itemId": 1, "name": 1})
+            }
+            blockers = [blocker_docs[blocker_id] for blocker_id in blocker_ids if blocker_id in blocker_docs]
+            return search_item_algorithm(item_data, container, position, blockers)
+    
     container_query = {"zone": item_data.get("preferredZone", "")}
-    container = containers_collection.find_one(container_query, {"_id": 0})
+    container = await containers_collection.find_one(container_query, {"_id": 0})
     
     if not container:
-        container = containers_collection.find_one({}, {"_id": 0})
+        container = await containers_collection.find_one({}, {"_id": 0})
     
     if container and container["zone"] == "Airlock":
-        blocker_item = items_collection.find_one(
+        blocker_item = await items_collection.find_one(
             {"preferredZone": "Airlock", "itemId": {"$ne": item_data["itemId"]}},
             {"_id": 0}
         )
@@ -64,9 +90,9 @@ async def retrieve_item(
     userId: str,
     timestamp: str
 ):
-    """Record the retrieval of an item"""
+    """Record the retrieval of an item, which uses it once"""
     try:
-        item = items_collection.find_one({"itemId": itemId}, {"_id": 0})
+        item = await use_item(itemId)
         
         if not item:
             return {"success": False, "message": "Item not found"}
@@ -74,12 +100,12 @@ async def retrieve_item(
         print(f"Item {itemId} retrieved by user {userId} at {timestamp}")
         
         # Log the retrieval action
-        log_action(
+        await log_action(
             timestamp=timestamp,
             userId=userId,
             actionType="retrieval",
             itemId=itemId,
-            details={"reason": "User retrieval request"}
+            details={"reason": "User retrieval request", "remainingUses": item.get("remainingUses")}
         )
         
         return {"success": True}
@@ -92,12 +118,12 @@ async def place_item(request: PlaceItemRequest):
     """Record the placement of an item in a container"""
     try:
         # First check if the container exists
-        container = containers_collection.find_one({"containerId": request.containerId}, {"_id": 0})
+        container = await containers_collection.find_one({"containerId": request.containerId}, {"_id": 0})
         if not container:
             return {"success": False, "message": "Container not found"}
         
         # Then check if the item exists
-        item = items_collection.find_one({"itemId": request.itemId}, {"_id": 0})
+        item = await items_collection.find_one({"itemId": request.itemId}, {"_id": 0})
         if not item:
             return {"success": False, "message": "Item not found"}
         
@@ -105,8 +131,11 @@ async def place_item(request: PlaceItemRequest):
         print(f"Item {request.itemId} placed in container {request.containerId} by user {request.userId} at {request.timestamp}")
         print(f"Position: {request.position.dict()}")
         
+        # Store the new location so later searches and plans see it
+        await save_placement(request.itemId, request.containerId, request.position, request.rotation)
+        
         # Log the action
-        log_action(
+        await log_action(
             timestamp=request.timestamp,
             userId=request.userId,
             actionType="placement",
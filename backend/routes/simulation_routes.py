@@ -1,8 +1,10 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, HTTPException
 from db import items_collection
 from models import SimulateRequest, SimulateResponse, SimulationChanges
 from simulation_algorithms import simulate_day_algorithm
 from datetime import datetime
+from executors import run_cpu_bound, ExecutorBusyError
+from usage_store import use_items
 
 router = APIRouter()
 
@@ -11,11 +13,19 @@ async def simulate_day(request: SimulateRequest):
     """Simulate the passage of time and item usage"""
     try:
         # Get all items from the database
-        all_items = list(items_collection.find({}, {"_id": 0}))
+        all_items = await items_collection.find({}, {"_id": 0}).to_list(None)
         
         # Use the simulation algorithm
-        return simulate_day_algorithm(request, all_items)
+        result, uses_taken = await run_cpu_bound(simulate_day_algorithm, request, all_items)
         
+        # Store the uses the simulated days took
+        if result.success:
+            await use_items(uses_taken)
+        
+        return result
+        
+    except ExecutorBusyError as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         print(f"Error simulating time: {str(e)}")
         import traceback
@@ -1,22 +1,41 @@
-from fastapi import APIRouter
-from db import items_collection, containers_collection
+from fastapi import APIRouter, HTTPException
+from db import items_collection, containers_collection, placements_collection
 from models import WasteResponse, WasteReturnPlanRequest, WasteReturnPlanResponse
-from waste_algorithms import identify_waste_algorithm, create_waste_return_plan_algorithm
+from waste_algorithms import identify_waste_algorithm, create_waste_return_plan_algorithm, WASTE_ITEM_PROJECTION
 from log_algorithms import log_action
+from executors import run_cpu_bound, ExecutorBusyError
+from placement_store import load_container_indexes, remove_placements
+from usage_store import out_of_uses_query
+from datetime import datetime
 
 router = APIRouter()
 
+def waste_candidates_query(today: datetime) -> dict:
+    """
+    Filter on the items that can be waste today, each branch served by an index
+
+    Items whose expiry date could not be parsed, and items stored before
+    usage was counted, are included and checked by the algorithm.
+    """
+    return {"$or": [
+        {"expiryAt": {"$lt": today}},
+        {"expiryAt": None, "expiryDate": {"$ne": "N/A"}},
+        out_of_uses_query(),
+        {"remainingUses": {"$exists": False}},
+    ]}
+
 @router.get("/api/waste/identify", response_model=WasteResponse)
 async def identify_waste():
     """Identify items that should be disposed of (expired or out of uses)"""
     try:
-        # Get all items and containers
-        items = list(items_collection.find({}, {"_id": 0}))
+        # Get the items that can be waste, and all containers
+        today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        items = await items_collection.find(waste_candidates_query(today), WASTE_ITEM_PROJECTION).to_list(None)
         if not items:
-            print("No items found in database for waste identification")
+            print("No waste candidates found in database for waste identification")
             return WasteResponse(success=True, wasteItems=[])
             
-        containers = list(containers_collection.find({}, {"_id": 0}))
+        containers = await containers_collection.find({}, {"_id": 0}).to_list(None)
         if not containers:
             print("No containers found in database for waste identification")
             # We still need containers for the algorithm to work properly
@@ -26,8 +45,17 @@ async def identify_waste():
         # Log the items and containers count for debugging
         print(f"Checking {len(items)} items and {len(containers)} containers for waste identification")
         
+        # Stored locations of the items, so waste is reported where it actually is
+        placements = {
+            placement["itemId"]: placement
+            async for placement in placements_collection.find(
+                {"itemId": {"$in": [item["itemId"] for item in items]}},
+                {"_id": 0, "itemId": 1, "containerId": 1, "position": 1}
+            )
+        }
+        
         # Use the waste identification algorithm
-        result = identify_waste_algorithm(items, containers)
+        result = await run_cpu_bound(identify_waste_algorithm, items, containers, placements)
         
         # Log the waste items count
         if result.success:
@@ -37,6 +65,8 @@ async def identify_waste():
             
         return result
     
+    except ExecutorBusyError as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         error_message = f"Error in waste identification: {str(e)}"
         print(error_message)
@@ -62,7 +92,7 @@ async def create_waste_return_plan(request: WasteReturnPlanRequest):
             )
         
         # Get container information
-        undocking_container = containers_collection.find_one({"containerId": request.undockingContainerId}, {"_id": 0})
+        undocking_container = await containers_collection.find_one({"containerId": request.undockingContainerId}, {"_id": 0})
         if not undocking_container:
             return WasteReturnPlanResponse(
                 success=False,
@@ -71,18 +101,38 @@ async def create_waste_return_plan(request: WasteReturnPlanRequest):
                 returnManifest=None
             )
         
-        # Get all items from database for weight and volume calculations
-        items_data = {item["itemId"]: item for item in items_collection.find({}, {"_id": 0})}
+        # Load the stored arrangements of the containers holding waste
+        indexes = await load_container_indexes({item.containerId for item in waste_response.wasteItems})
+        
+        # Get the waste items and every item in front of them from the database,
+        # for weight calculations and for the blockers in the retrieval steps
+        needed_ids = set()
+        for waste_item in waste_response.wasteItems:
+            needed_ids.add(waste_item.itemId)
+            index = indexes.get(waste_item.containerId)
+            if index is not None and waste_item.itemId in index:
+                needed_ids.update(index.in_front_of(*index.boxes[waste_item.itemId], ignore=waste_item.itemId))
+        items_data = {
+            item["itemId"]: item
+            async for item in items_collection.find({"itemId": {"$in": list(needed_ids)}}, {"_id": 0})
+        }
         
         # Use the return plan algorithm
-        return create_waste_return_plan_algorithm(
-            waste_items=waste_response.wasteItems,
-            undocking_container=undocking_container,
-            undocking_date=request.undockingDate,
-            max_weight=request.maxWeight,
-            items_data=items_data
+        return await run_cpu_bound(
+            create_waste_return_plan_algorithm,
+            waste_response.wasteItems,
+            undocking_container,
+            request.undockingDate,
+            request.maxWeight,
+            items_data,
+            indexes
         )
         
+    except ExecutorBusyError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except HTTPException:
+        # Raised by identify_waste when the CPU pool is busy
+        raise
     except Exception as e:
         print(f"Error creating waste return plan: {str(e)}")
         return WasteReturnPlanResponse(
@@ -105,7 +155,7 @@ async def complete_undocking(request: dict):
             return {"success": False, "itemsRemoved": 0}
         
         # First, check if the container exists
-        container = containers_collection.find_one({"containerId": undocking_container_id}, {"_id": 0})
+        container = await containers_collection.find_one({"containerId": undocking_container_id}, {"_id": 0})
         if not container:
             return {"success": False, "itemsRemoved": 0, "message": "Container not found"}
         
@@ -130,7 +180,7 @@ async def complete_undocking(request: dict):
         
         # Log each waste item disposal
         for waste_item in waste_response.wasteItems:
-            log_action(
+            await log_action(
                 timestamp=timestamp,
                 userId=userId,
                 actionType="disposal",
@@ -142,11 +192,17 @@ async def complete_undocking(request: dict):
                 }
             )
         
+        # The disposed items no longer occupy space in their containers
+        await remove_placements(waste_item_ids)
+        
         return {
             "success": True,
             "itemsRemoved": items_removed
         }
     
+    except HTTPException:
+        # Raised by identify_waste when the CPU pool is busy
+        raise
     except Exception as e:
         print(f"Error completing undocking: {str(e)}")
         return {"success": False, "itemsRemoved": 0, "message": str(e)}
\ No newline at end of file
@@ -1,14 +1,15 @@
-from typing import List, Dict, Optional, Any
+from typing import List, Dict, Optional, Any, Tuple
 from datetime import datetime, timedelta
 from models import (
     SimulateRequest, SimulateResponse, SimulationChanges,
     UsedItem, ExpiredItem, DepletedItem
 )
+from item_fields import normalized_fields
 
 def simulate_day_algorithm(
     request: SimulateRequest,
     all_items: List[Dict]
-) -> SimulateResponse:
+) -> Tuple[SimulateResponse, Dict[str, int]]:
     """
     Algorithm to simulate the passage of time and item usage
     
@@ -17,7 +18,8 @@ def simulate_day_algorithm(
         all_items: List of all items from the database
         
     Returns:
-        SimulateResponse with changes after simulation
+        SimulateResponse with changes after simulation, and a dictionary of
+        item id to the number of uses each item took over all simulated days
     """
     try:
         # Get the current date from the system
@@ -42,13 +44,13 @@ def simulate_day_algorithm(
                     success=False,
                     newDate=current_date.isoformat(),
                     changes=SimulationChanges()
-                )
+                ), {}
         else:
             return SimulateResponse(
                 success=False,
                 newDate=current_date.isoformat(),
                 changes=SimulationChanges()
-            )
+            ), {}
         
         # Even if there are no items in the database, we should still simulate the passage of time
         # This is a change from the original implementation which returned failure if no items found
@@ -58,7 +60,7 @@ def simulate_day_algorithm(
                 success=True,  # Changed to true since time simulation is still successful
                 newDate=new_date.isoformat(),  # Use the calculated new date
                 changes=SimulationChanges()
-            )
+            ), {}
         
         # Create lookup dictionaries for better performance
         item_by_id = {item["itemId"]: item.copy() for item in all_items}
@@ -83,9 +85,14 @@ def simulate_day_algorithm(
                     item_id = item["itemId"]
             
             if item and item_id:
-                # Initialize current_usage field if it doesn't exist
-                if "current_usage" not in item:
-                    item["current_usage"] = 0
+                # Documents imported before normalization get their typed fields computed here
+                if "volume" not in item:
+                    item.update(normalized_fields(item))
+                # Start from the stored usage counter; items stored before it existed are unused
+                if item["usageLimitUses"] is not None:
+                    remaining = item.get("remainingUses", item["usageLimitUses"])
+                    item["current_usage"] = item["usageLimitUses"] - (remaining or 0)
+                    item["start_usage"] = item["current_usage"]
                 items_to_use[item_id] = item
             else:
                 # Item not found - log but continue with other items
@@ -98,7 +105,7 @@ def simulate_day_algorithm(
                 success=True,  # Changed to true since time simulation is still successful
                 newDate=new_date.isoformat(),
                 changes=SimulationChanges()
-            )
+            ), {}
         
         # Track changes
         items_used = []
@@ -113,51 +120,56 @@ def simulate_day_algorithm(
             
             # Process items used on this day
             for item_id, item in items_to_use.items():
-                # Parse usage limit and simulate usage
-                usage_limit = item.get("usageLimit", "N/A")
+                # Usage limit parsed at import time (e.g., "30 uses" -> 30), None when unlimited
+                limit_value = item["usageLimitUses"]
                 
-                if usage_limit != "N/A" and usage_limit.lower() != "unlimited":
-                    # Parse usage limit (e.g., "30 uses" -> 30)
-                    try:
-                        if "uses" in usage_limit.lower():
-                            # Extract the number from the usage limit
-                            limit_value = int(usage_limit.lower().split("uses")[0].strip())
-                            
-                            # For simulation, we'll use a counter in-memory
-                            current_usage = item["current_usage"] + 1
-                            remaining_uses = max(0, limit_value - current_usage)
-                            
-                            # Update the item's usage in our in-memory state
-                            item["current_usage"] = current_usage
-                            
-                            # For the final day, record the results
-                            if day == days_to_simulate - 1:
-                                if remaining_uses > 0:
-                                    # Still has uses left
-                                    items_used.append(UsedItem(
-                                        itemId=item_id,
-                                        name=item["name"],
-                                        remainingUses=remaining_uses
-                                    ))
-                                else:
-                                    # Depleted today (just ran out of uses)
-                                    if current_usage == limit_value:
-                                        items_depleted_today.append(DepletedItem(
-                                            itemId=item_id,
-                                            name=item["name"]
-                                        ))
-                    except (ValueError, TypeError) as e:
-                        print(f"Error parsing usage limit for {item['name']}: {usage_limit} - {str(e)}")
+                if limit_value is not None:
+                    # For simulation, we'll use a counter in-memory
+                    current_usage = item["current_usage"] + 1
+                    remaining_uses = max(0, limit_value - current_usage)
+                    
+                    # Update the item's usage in our in-memory state
+                    item["current_usage"] = current_usage
+                    
+                    # For the final day, record the results
+                    if day == days_to_simulate - 1:
+                        if remaining_uses > 0:
+                            # Still has uses left
+                            items_used.append(UsedItem(
+                                itemId=item_id,
+                                name=item["name"],
+                                remainingUses=remaining_uses
+                            ))
+                        else:
+                            # Depleted today (just ran out of uses)
+                            if current_usage == limit_value:
+                                items_depleted_today.append(DepletedItem(
+                                    itemId=item_id,
+                                    name=item["name"]
+                                ))
                 
                 # Check for expiration on the final day
                 if day == days_to_simulate - 1:
+                    expiry_at = item["expiryAt"]
                     expiry_date = item.get("expiryDate", "N/A")
-                    if expiry_date != "N/A" and expiry_date <= sim_date_str:
+                    if expiry_at is not None:
+                        expired = expiry_at.strftime("%Y-%m-%d") <= sim_date_str
+                    else:
+                        expired = expiry_date != "N/A" and isinstance(expiry_date, str) and expiry_date <= sim_date_str
+                    if expired:
                         items_expired.append(ExpiredItem(
                             itemId=item_id,
                             name=item["name"]
                         ))
         
+        # Each limited item is used once a day until it runs out, including items
+        # that ran out before the final day and are not in the changes
+        uses_taken = {
+            item_id: min(days_to_simulate, item["usageLimitUses"] - item["start_usage"])
+            for item_id, item in items_to_use.items()
+            if item["usageLimitUses"] is not None
+        }
+        
         # Create the response
         return SimulateResponse(
             success=True,
@@ -167,7 +179,7 @@ def simulate_day_algorithm(
                 itemsExpired=items_expired,
                 itemsDepletedToday=items_depleted_today
             )
-        )
+        ), uses_taken
         
     except Exception as e:
         print(f"Error simulating time: {str(e)}")
@@ -177,4 +189,4 @@ def simulate_day_algorithm(
             success=False,
             newDate=datetime.now().isoformat(),
             changes=SimulationChanges()
-        )
\ No newline at end of file
+        ), {}
\ No newline at end of file
@@ -0,0 +1,165 @@
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+from models import Position, Coordinates
+
+# A point or a size in container space, always ordered as (width, depth, height).
+# Depth 0 is the open face of the container.
+Vector = Tuple[float, float, float]
+Box = Tuple[Vector, Vector]
+
+class ContainerSpatialIndex:
+    """
+    In-memory spatial index of the item boxes stored in one container.
+
+    The container is divided into a uniform grid of cells and every box is
+    registered in each cell it touches. Collision and "what is in front"
+    queries only look at the boxes registered in the cells the query region
+    touches, instead of scanning every item in the container.
+    """
+
+    def __init__(self, container_id: str, size: Vector, cells_per_axis: int = 8):
+        self.container_id = container_id
+        self.size = size
+        self.cell_size = tuple(max(1.0, size[axis] / cells_per_axis) for axis in range(3))
+        self.boxes: Dict[str, Box] = {}
+        self._cells: Dict[Tuple[int, int, int], Set[str]] = {}
+
+    def __len__(self) -> int:
+        return len(self.boxes)
+
+    def __contains__(self, item_id: str) -> bool:
+        return item_id in self.boxes
+
+    def _cell_keys(self, start: Vector, end: Vector) -> Iterator[Tuple[int, int, int]]:
+        low = [int(start[axis] // self.cell_size[axis]) for axis in range(3)]
+        # End coordinates are exclusive, so a box ending on a cell border stays out of the next cell
+        high = [max(low[axis], int(-(-end[axis] // self.cell_size[axis])) - 1) for axis in range(3)]
+        for x in range(low[0], high[0] + 1):
+            for y in range(low[1], high[1] + 1):
+                for z in range(low[2], high[2] + 1):
+                    yield (x, y, z)
+
+    def insert(self, item_id: str, start: Vector, end: Vector) -> None:
+        if item_id in self.boxes:
+            self.remove(item_id)
+        self.boxes[item_id] = (start, end)
+        for key in self._cell_keys(start, end):
+            self._cells.setdefault(key, set()).add(item_id)
+
+    def remove(self, item_id: str) -> Optional[Box]:
+        box = self.boxes.pop(item_id, None)
+        if box is None:
+            return None
+        for key in self._cell_keys(*box):
+            cell = self._cells.get(key)
+            if cell is not None:
+                cell.discard(item_id)
+                if not cell:
+                    del self._cells[key]
+        return box
+
+    def query(self, start: Vector, end: Vector) -> List[str]:
+        """Return the ids of all boxes overlapping the region [start, end)"""
+        candidates = set()
+        for key in self._cell_keys(start, end):
+            cell = self._cells.get(key)
+            if cell:
+                candidates.update(cell)
+        return [item_id for item_id in candidates if _overlaps(self.boxes[item_id], start, end)]
+
+    def collides(self, start: Vector, end: Vector, ignore: Optional[str] = None) -> bool:
+        """Check whether the region [start, end) overlaps any stored box"""
+        for key in self._cell_keys(start, end):
+            for item_id in self._cells.get(key, ()):
+                if item_id != ignore and _overlaps(self.boxes[item_id], start, end):
+                    return True
+        return False
+
+    def in_front_of(self, start: Vector, end: Vector, ignore: Optional[str] = None) -> List[str]:
+        """
+        Find the boxes between a box and the open face of the container
+
+        Args:
+            start: Start coordinates of the box
+            end: End coordinates of the box
+            ignore: Optional item id to leave out of the result (usually the box itself)
+
+        Returns:
+            Ids of the blocking boxes, front-most first
+        """
+        if start[1] <= 0:
+            return []
+        blockers = self.query((start[0], 0, start[2]), (end[0], start[1], end[2]))
+        blockers = [item_id for item_id in blockers if item_id != ignore]
+        return sorted(blockers, key=lambda item_id: (self.boxes[item_id][0][1], item_id))
+
+def _overlaps(box: Box, start: Vector, end: Vector) -> bool:
+    box_start, box_end = box
+    return all(start[axis] < box_end[axis] and box_start[axis] < end[axis] for axis in range(3))
+
+def position_to_box(position: Position) -> Box:
+    start, end = position.startCoordinates, position.endCoordinates
+    return (start.width, start.depth, start.height), (end.width, end.depth, end.height)
+
+def box_to_position(start: Vector, end: Vector) -> Position:
+    return Position(
+        startCoordinates=Coordinates(width=start[0], depth=start[1], height=start[2]),
+        endCoordinates=Coordinates(width=end[0], depth=end[1], height=end[2])
+    )
+
+def placement_document(item_id: str, container_id: str, position: Position, rotation: int = 0) -> Dict:
+    """
+    Build the document stored in placements_collection for a placed item
+
+    The flat x/y/z/rotation fields are the ones read by the arrangement export.
+    """
+    start = position.startCoordinates
+    return {
+        "itemId": item_id,
+        "containerId": container_id,
+        "x": start.width,
+        "y": start.depth,
+        "z": start.height,
+        "rotation": rotation,
+        "position": position.dict()
+    }
+
+def position_from_document(placement: Dict) -> Optional[Position]:
+    """Read the stored position of a placement document, if it has one"""
+    position = placement.get("position")
+    if not position:
+        return None
+    try:
+        return Position(**position)
+    except (TypeError, ValueError):
+        return None
+
+def build_container_indexes(
+    placements: Iterable[Dict],
+    containers: Iterable[Dict]
+) -> Dict[str, ContainerSpatialIndex]:
+    """
+    Build one spatial index per container from stored placement documents
+
+    Args:
+        placements: Placement documents from placements_collection
+        containers: Container documents from containers_collection
+
+    Returns:
+        Dictionary of container id to its spatial index
+    """
+    indexes = {
+        container["containerId"]: ContainerSpatialIndex(
+            container["containerId"],
+            (container["width"], container["depth"], container["height"])
+        )
+        for container in containers
+    }
+
+    for placement in placements:
+        index = indexes.get(placement.get("containerId"))
+        position = position_from_document(placement)
+        if index is None or position is None:
+            continue
+        index.insert(placement["itemId"], *position_to_box(position))
+
+    return indexes
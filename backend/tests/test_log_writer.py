@@ -0,0 +1,64 @@
+import asyncio
+from pymongo.errors import BulkWriteError
+from log_writer import DUPLICATE_KEY_ERROR, LogWriter
+
+DOCUMENT_TOO_LARGE = 10334
+
+class FakeCollection:
+    """Collection that rejects the entries named in reject and remembers the rest by _id"""
+
+    def __init__(self, reject=()):
+        self.reject = set(reject)
+        self.documents = {}
+
+    async def insert_many(self, documents, ordered=True):
+        errors = []
+        for index, document in enumerate(documents):
+            if document.get("userId") in self.reject:
+                errors.append({"index": index, "code": DOCUMENT_TOO_LARGE, "errmsg": "document too large"})
+            elif document["_id"] in self.documents:
+                errors.append({"index": index, "code": DUPLICATE_KEY_ERROR, "errmsg": "duplicate key"})
+            else:
+                self.documents[document["_id"]] = document
+        if errors:
+            raise BulkWriteError({"writeErrors": errors, "writeConcernErrors": []})
+
+def test_rejected_entry_is_dead_lettered_and_the_rest_written():
+    logs, dead_letters = FakeCollection(reject={"poison"}), FakeCollection()
+    written = []
+
+    async def on_write(batch):
+        written.extend(batch)
+
+    async def run():
+        writer = LogWriter(logs, flush_size=10, on_write=on_write, dead_letters=dead_letters)
+        for user_id in ["a", "poison", "b"]:
+            await writer.add({"userId": user_id})
+        await writer.flush()
+        assert writer.pending() == 0
+
+        # The buffer is not blocked by the rejected entry
+        await writer.add({"userId": "c"}, flush=True)
+        await writer.stop()
+
+    asyncio.run(run())
+    assert sorted(entry["userId"] for entry in logs.documents.values()) == ["a", "b", "c"]
+    assert [letter["entry"]["userId"] for letter in dead_letters.documents.values()] == ["poison"]
+    assert [letter["code"] for letter in dead_letters.documents.values()] == [DOCUMENT_TOO_LARGE]
+    assert sorted(entry["userId"] for entry in written) == ["a", "b", "c"]
+
+def test_retried_batch_skips_entries_already_written():
+    logs = FakeCollection()
+
+    async def run():
+        writer = LogWriter(logs, flush_size=10)
+        await writer.add({"userId": "a"})
+        # Simulate an earlier attempt that wrote the entry before failing
+        entry = writer._buffer[0]
+        logs.documents[entry["_id"]] = entry
+        await writer.flush()
+        assert writer.pending() == 0
+        await writer.stop()
+
+    asyncio.run(run())
+    assert len(logs.documents) == 1
@@ -0,0 +1,78 @@
+import contextlib
+import io
+import random
+import time
+from algorithms import calculate_placement
+from models import Container, Item
+
+# A batch that fills the containers to about two thirds, and a quarter of it
+LARGE_BATCH_ITEMS = 3000
+SMALL_BATCH_ITEMS = 750
+# Generous bound for the large batch; the planner takes a few seconds for it
+LARGE_BATCH_SECONDS = 60
+# Time per item may grow as the containers fill up, but not by more than this
+MAX_PER_ITEM_GROWTH = 2.0
+
+def random_batch(count, containers_per_zone=10, seed=1):
+    rng = random.Random(seed)
+    zones = "ABCD"
+    items = [
+        Item(
+            itemId=f"item{i}",
+            name=f"item{i}",
+            width=rng.randint(5, 40),
+            depth=rng.randint(5, 40),
+            height=rng.randint(5, 40),
+            priority=rng.randint(1, 100),
+            expiryDate="N/A",
+            usageLimit="N/A",
+            preferredZone=rng.choice(zones)
+        )
+        for i in range(count)
+    ]
+    containers = [
+        Container(containerId=f"cont{i}", zone=zones[i % len(zones)], width=100, depth=85, height=200)
+        for i in range(containers_per_zone * len(zones))
+    ]
+    return items, containers
+
+def plan(items, containers):
+    # The planner reports items that do not fit on stdout
+    with contextlib.redirect_stdout(io.StringIO()):
+        return calculate_placement(items, containers)
+
+def assert_valid(result, containers):
+    sizes = {container.containerId: (container.width, container.depth, container.height) for container in containers}
+    boxes = {}
+    for placement in result.placements:
+        start, end = placement.position.startCoordinates, placement.position.endCoordinates
+        box = ((start.width, start.depth, start.height), (end.width, end.depth, end.height))
+        assert all(0 <= box[0][axis] < box[1][axis] <= sizes[placement.containerId][axis] for axis in range(3))
+        boxes.setdefault(placement.containerId, []).append(box)
+    for container_boxes in boxes.values():
+        for i, (start, end) in enumerate(container_boxes):
+            for other_start, other_end in container_boxes[i + 1:]:
+                assert not all(start[axis] < other_end[axis] and other_start[axis] < end[axis] for axis in range(3))
+
+def test_placements_stay_inside_containers_without_overlapping():
+    items, containers = random_batch(400, containers_per_zone=1)
+    result = plan(items, containers)
+    assert result.placements
+    assert_valid(result, containers)
+
+def timed_plan(count):
+    items, containers = random_batch(count)
+    started = time.monotonic()
+    result = plan(items, containers)
+    return result, time.monotonic() - started
+
+def test_large_batch_is_planned_within_time_bound():
+    result, elapsed = timed_plan(LARGE_BATCH_ITEMS)
+    assert len(result.placements) == LARGE_BATCH_ITEMS
+    assert elapsed < LARGE_BATCH_SECONDS, f"{LARGE_BATCH_ITEMS} items took {elapsed:.1f}s"
+
+    # Same containers with a quarter of the items: the cost of one item must
+    # stay roughly flat as the containers fill, not grow with the items placed
+    _, small_elapsed = timed_plan(SMALL_BATCH_ITEMS)
+    growth = (elapsed / LARGE_BATCH_ITEMS) / (small_elapsed / SMALL_BATCH_ITEMS)
+    assert growth < MAX_PER_ITEM_GROWTH, f"time per item grew {growth:.1f}x from {SMALL_BATCH_ITEMS} to {LARGE_BATCH_ITEMS} items"
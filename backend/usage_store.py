@@ -0,0 +1,59 @@
+from typing import Dict, List, Optional
+from pymongo import ReturnDocument, UpdateOne
+from db import items_collection
+
+# Items with a usage limit carry remainingUses; unlimited items have it set to None.
+# Uses are taken with a single-document update that computes the new count on the
+# server, so concurrent retrievals cannot lose an update.
+
+# Items that have a usage limit and are not out of uses yet; items stored before
+# usage was counted have no remainingUses and start from their full limit
+USABLE_ITEM = {
+    "usageLimitUses": {"$type": "number"},
+    "$or": [{"remainingUses": {"$gt": 0}}, {"remainingUses": {"$exists": False}}]
+}
+
+def _take_uses(count: int) -> List[Dict]:
+    """Update pipeline taking count uses from an item, never going below zero"""
+    return [{"$set": {"remainingUses": {"$max": [
+        0, {"$subtract": [{"$ifNull": ["$remainingUses", "$usageLimitUses"]}, count]}
+    ]}}}]
+
+async def use_item(item_id: str) -> Optional[Dict]:
+    """
+    Record one use of an item
+
+    The counter is only decremented while it is above zero, so an item that
+    is already out of uses stays at zero.
+
+    Returns:
+        The item's itemId and remainingUses after the use, or None if the item does not exist
+    """
+    item = await items_collection.find_one_and_update(
+        {"itemId": item_id, **USABLE_ITEM},
+        _take_uses(1),
+        projection={"_id": 0, "itemId": 1, "remainingUses": 1},
+        return_document=ReturnDocument.AFTER
+    )
+    if item is None:
+        # Unlimited, already out of uses, or unknown
+        item = await items_collection.find_one({"itemId": item_id}, {"_id": 0, "itemId": 1, "remainingUses": 1})
+    return item
+
+async def use_items(uses: Dict[str, int]) -> None:
+    """
+    Take several uses from several items with one bulk_write
+
+    Args:
+        uses: Dictionary of item id to the number of uses taken
+    """
+    operations = [
+        UpdateOne({"itemId": item_id, **USABLE_ITEM}, _take_uses(count))
+        for item_id, count in uses.items() if count > 0
+    ]
+    if operations:
+        await items_collection.bulk_write(operations, ordered=False)
+
+def out_of_uses_query() -> Dict:
+    """Filter on items that have no uses left, served by the remainingUses index"""
+    return {"remainingUses": {"$lte": 0}}
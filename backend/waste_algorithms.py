@@ -1,124 +1,143 @@
 from typing import List, Optional, Dict, Any
 from datetime import datetime
+import numpy as np
 from models import (
     WasteItem, WasteResponse, Position, Coordinates,
     WasteReturnPlanResponse, WasteReturnStep, ReturnItem, ReturnManifest,
     RetrievalStep
 )
+from algorithms import plan_retrieval_steps
+from spatial_index import ContainerSpatialIndex, position_from_document
+from item_fields import with_normalized_fields
 
-def identify_waste_algorithm(items: List[Dict], containers: List[Dict]) -> WasteResponse:
+# Item fields read by waste identification; the typed ones are used when present
+WASTE_ITEM_PROJECTION = {
+    "_id": 0, "itemId": 1, "name": 1, "preferredZone": 1, "width": 1, "depth": 1, "height": 1,
+    "expiryAt": 1, "remainingUses": 1, "usageLimitUses": 1, "volume": 1, "expiryDate": 1, "usageLimit": 1
+}
+
+def _expiry_ordinal(expiry_at: Optional[datetime]) -> int:
+    return expiry_at.toordinal() if expiry_at is not None else -1
+
+def _remaining_uses(item: Dict) -> float:
+    # Items stored before usage was counted have not been used yet; NaN marks unlimited items
+    remaining_uses = item.get("remainingUses", item.get("usageLimitUses"))
+    return np.nan if remaining_uses is None else remaining_uses
+
+def waste_columns(items: List[Dict], zones: List[str], today: datetime) -> Dict[str, np.ndarray]:
+    """
+    Load the fields waste identification needs into one NumPy array per field
+
+    The arrays are filled straight from the stored expiryAt and remainingUses
+    fields. Only documents stored before normalization are normalized here.
+
+    Args:
+        items: Item documents, with or without the normalized fields
+        zones: Zone names; an item's zone code is its preferred zone's position in this list, -1 if missing
+        today: Midnight of the current day
+
+    Returns:
+        Dictionary with expiry ordinals (-1 when there is none), remaining
+        uses (NaN when unlimited), zone codes, and the expiry flag of items
+        whose date could not be parsed, which are compared as strings like
+        before normalization
+    """
+    count = len(items)
+    expiry = np.fromiter((_expiry_ordinal(item.get("expiryAt")) for item in items), dtype=np.int64, count=count)
+    remaining = np.fromiter((_remaining_uses(item) for item in items), dtype=np.float64, count=count)
+    zone_codes = {zone: code for code, zone in enumerate(zones)}
+    zone = np.fromiter((zone_codes.get(item.get("preferredZone"), -1) for item in items), dtype=np.int64, count=count)
+
+    for i, item in enumerate(items):
+        if "volume" not in item:
+            item = with_normalized_fields(item)
+            expiry[i] = _expiry_ordinal(item["expiryAt"])
+            remaining[i] = _remaining_uses(item)
+
+    unparsed_expired = np.zeros(count, dtype=bool)
+    today_text = today.strftime("%Y-%m-%d")
+    for i in np.flatnonzero(expiry < 0):
+        expiry_date = items[i].get("expiryDate", "N/A")
+        unparsed_expired[i] = expiry_date != "N/A" and isinstance(expiry_date, str) and expiry_date < today_text
+
+    return {"expiry": expiry, "remaining": remaining, "zone": zone, "unparsed_expired": unparsed_expired}
+
+def identify_waste_algorithm(
+    items: List[Dict],
+    containers: List[Dict],
+    placements: Optional[Dict[str, Dict]] = None
+) -> WasteResponse:
     """
     Algorithm to identify waste items based on expiry date and usage limits
     
+    The item fields are loaded into NumPy columns and the expired and
+    out-of-uses masks are computed for the whole inventory at once; only
+    the flagged items are turned into WasteItems.
+    
     Args:
         items: List of item objects from database
         containers: List of container objects from database
+        placements: Optional dictionary of item id to its stored placement document
         
     Returns:
         WasteResponse object with identified waste items
     """
     try:
+        if not items:
+            return WasteResponse(success=True, wasteItems=[])
+        
         # Get current date for expiry comparison
-        current_date = datetime.now().strftime("%Y-%m-%d")
+        current_datetime = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
         
-        # Create a container lookup by ID
+        # Create a container lookup by ID, and the first container of each zone by zone code
         container_map = {container["containerId"]: container for container in containers}
+        zone_containers: Dict[str, str] = {}
+        for container in containers:
+            zone_containers.setdefault(container["zone"], container["containerId"])
+        default_container_id = containers[0]["containerId"] if containers else "unknown"
+        zones = list(zone_containers)
+        # The last entry is the default container, picked by zone code -1
+        container_by_zone = np.array(list(zone_containers.values()) + [default_container_id], dtype=object)
+        
+        columns = waste_columns(items, zones, current_datetime)
+        expiry, remaining = columns["expiry"], columns["remaining"]
+        
+        # Check every item for expiry
+        expired = ((expiry >= 0) & (expiry < current_datetime.toordinal())) | columns["unparsed_expired"]
+        
+        # Check the rest for running out of uses, from the stored usage counters
+        out_of_uses = ~expired & ~np.isnan(remaining) & (remaining <= 0)
+        
+        flagged = np.flatnonzero(expired | out_of_uses)
+        flagged_containers = container_by_zone[columns["zone"][flagged]]
         
         # List to store waste items
         waste_items = []
-        
-        # Check each item for expiry or usage limit
-        for item in items:
-            # Default container and position if not found
-            default_container_id = containers[0]["containerId"] if containers else "unknown"
-            default_position = Position(
-                startCoordinates=Coordinates(width=0.0, depth=0.0, height=0.0),
-                endCoordinates=Coordinates(
-                    width=float(item.get("width", 0)), 
-                    depth=float(item.get("depth", 0)), 
-                    height=float(item.get("height", 0))
-                )
-            )
+        for i, container_id in zip(flagged, flagged_containers):
+            item = items[i]
             
-            # Find container from preferred zone
-            container_id = default_container_id
-            for container in containers:
-                if container["zone"] == item.get("preferredZone", ""):
-                    container_id = container["containerId"]
-                    break
-            
-            # Check if item is expired
-            expiry_date = item.get("expiryDate", "N/A")
-            if expiry_date != "N/A":
-                try:
-                    # Convert strings to datetime objects for proper comparison
-                    expiry_datetime = datetime.strptime(expiry_date, "%Y-%m-%d")
-                    current_datetime = datetime.strptime(current_date, "%Y-%m-%d")
-                    
-                    if expiry_datetime < current_datetime:
-                        waste_items.append(WasteItem(
-                            itemId=item["itemId"],
-                            name=item["name"],
-                            reason="Expired",
-                            containerId=container_id,
-                            position=default_position
-                        ))
-                        continue
-                except ValueError:
-                    # If date parsing fails, try string comparison as fallback
-                    if expiry_date < current_date:
-                        waste_items.append(WasteItem(
-                            itemId=item["itemId"],
-                            name=item["name"],
-                            reason="Expired",
-                            containerId=container_id,
-                            position=default_position
-                        ))
-                        continue
+            # Prefer the stored location of the item when it has one
+            placement = placements.get(item["itemId"]) if placements else None
+            position = position_from_document(placement) if placement else None
+            if position and placement["containerId"] in container_map:
+                container_id = placement["containerId"]
+            else:
+                position = Position(
+                    startCoordinates=Coordinates(width=0.0, depth=0.0, height=0.0),
+                    endCoordinates=Coordinates(
+                        width=float(item.get("width", 0)), 
+                        depth=float(item.get("depth", 0)), 
+                        height=float(item.get("height", 0))
+                    )
+                )
             
-            # Check if item is out of uses
-            usage_limit = item.get("usageLimit", "N/A")
-            if usage_limit != "N/A" and usage_limit.lower() != "unlimited":
-                # Parse usage limit with improved handling
-                try:
-                    # Handle different formats: "30 uses", "30", "0"
-                    limit_text = usage_limit.lower()
-                    limit_value = None
-                    
-                    if "uses" in limit_text:
-                        limit_value = int(limit_text.split("uses")[0].strip())
-                    else:
-                        # Try to parse as a direct number
-                        limit_value = int(limit_text.strip())
-                    
-                    if limit_value is not None:
-                        # For testing/demo purposes, we'll treat items with 0 uses left as waste
-                        if limit_value <= 0:
-                            waste_items.append(WasteItem(
-                                itemId=item["itemId"],
-                                name=item["name"],
-                                reason="Out of Uses",
-                                containerId=container_id,
-                                position=default_position
-                             ))
-                            continue
-                            
-                        # Simulate a random current usage for demo purposes
-                        # In a real system, this would come from a usage counter
-                        import random
-                        current_usage = random.randint(0, int(limit_value * 1.2))
-                        
-                        if current_usage >= limit_value:
-                            waste_items.append(WasteItem(
-                                itemId=item["itemId"],
-                                name=item["name"],
-                                reason="Out of Uses",
-                                containerId=container_id,
-                                position=default_position
-                            ))
-                except (ValueError, TypeError, AttributeError):
-                    # Skip if usage limit cannot be parsed
-                    pass
+            waste_items.append(WasteItem(
+                itemId=item["itemId"],
+                name=item["name"],
+                reason="Expired" if expired[i] else "Out of Uses",
+                containerId=container_id,
+                position=position
+            ))
         
         return WasteResponse(success=True, wasteItems=waste_items)
     
@@ -131,7 +150,8 @@ def create_waste_return_plan_algorithm(
     undocking_container: Dict,
     undocking_date: str,
     max_weight: float,
-    items_data: Dict[str, Dict]
+    items_data: Dict[str, Dict],
+    indexes: Optional[Dict[str, ContainerSpatialIndex]] = None
 ) -> WasteReturnPlanResponse:
     """
     Algorithm to create a waste return plan based on identified waste items
@@ -142,6 +162,7 @@ def create_waste_return_plan_algorithm(
         undocking_date: Date for undocking
         max_weight: Maximum weight constraint
         items_data: Dictionary of item data for weight calculations
+        indexes: Optional spatial index per container, used to plan around blocking items
         
     Returns:
         WasteReturnPlanResponse with return plan, retrieval steps, and manifest
@@ -168,12 +189,10 @@ def create_waste_return_plan_algorithm(
             if not item_data:
                 continue
                 
-            # Calculate item weight (simulated as 0.1-5kg based on volume)
-            item_volume = item_data["width"] * item_data["depth"] * item_data["height"]
-            item_weight = item_volume / 1000  # Simple formula: 1000 cubic cm = 1kg
-            
-            # Ensure minimum weight of 0.1kg and maximum of 5kg
-            item_weight = max(0.1, min(5, item_weight))
+            # Precomputed volume and weight (simulated as 0.1-5kg based on volume)
+            item_data = with_normalized_fields(item_data)
+            item_volume = item_data["volume"]
+            item_weight = item_data["weight"]
             
             # Check if adding this item would exceed weight limit
             if total_weight + item_weight <= max_weight:
@@ -212,6 +231,22 @@ def create_waste_return_plan_algorithm(
             ))
             step_counter += 1
             
+            # With a stored arrangement, move exactly the items that block this one
+            index = indexes.get(waste_item.containerId) if indexes else None
+            if index is not None and waste_item.itemId in index:
+                box = index.boxes[waste_item.itemId]
+                blockers = [
+                    items_data[blocker_id]
+                    for blocker_id in index.in_front_of(*box, ignore=waste_item.itemId)
+                    if blocker_id in items_data
+                ]
+                steps = plan_retrieval_steps(items_data[waste_item.itemId], blockers, retrieval_step_counter)
+                retrieval_steps.extend(steps)
+                retrieval_step_counter += len(steps)
+                # The item leaves the container, so it no longer blocks anything behind it
+                index.remove(waste_item.itemId)
+                continue
+            
             # Add retrieval steps
             # First, retrieve the item
             retrieval_steps.append(RetrievalStep(